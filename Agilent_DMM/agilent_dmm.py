@@ -1,26 +1,126 @@
+import os
+import sys
+import json
 import yaml
+import hashlib
 import argparse
 import logging
 import time
-import qcodes as qc
-from qcodes.instrument_drivers.Keysight import Keysight34461A
-import matplotlib.pyplot as plt
-from collections import deque
-import pandas as pd
+import numpy as np
 from datetime import datetime
 import signal
 import threading
+from recorder import RECORDERS, SegmentedRecorder
+from sample_buffer import SampleBuffer
+from scheduler import DeadlineScheduler
+from instrumentation import StageTimer, NullTimer
+from online_stats import OnlineStats
+from shared_ring import SharedRing
+from sample_stream import SamplePublisher
+from segments import find_incomplete, read_manifest
+from sim_instrument import SimulatedKeysight34461A
+from backends import Backend, Kt34400Backend, NidaqBackend, PyvisaKeysight34461A, ReplayBackend
+
+class AgilentDMM(Backend):
+    BURST_MAX_SAMPLES = 1000000  # Largest SAMP:COUN the 34461A accepts; only sizes the burst, not a fetch
+    READING_MEMORY = 10000  # Readings the 34461A's reading memory holds
+    PROFILE_QUERY = (':VOLT:DC:RANG?;:VOLT:DC:NPLC?;:VOLT:DC:ZERO:AUTO?;:VOLT:DC:RES?;'
+                     ':TRIG:SOUR?;:TRIG:DEL?;:TRIG:COUN?;:SAMP:COUN?;:DISP?;:FORM:DATA?;:SAMP:SOUR?')
+    POLL_STATE = ':FORM:DATA ASC;:SAMP:SOUR IMM;:SAMP:COUN 1'  # Undoes start_burst so READ? polls work again
+    SOURCES = {'kt34400': Kt34400Backend, 'nidaq': NidaqBackend, 'replay': ReplayBackend}  # Backends other than the DMM
 
-class AgilentDMM:
     def __init__(self, config):
+        self.config = config
         self.visa_addr = config['visa_addr']
+        self.source_type = config.get('source', 'dmm')  # 'dmm', 'kt34400' (Keysight IVI driver), 'nidaq' or 'replay'
+        self.daemon = config.get('daemon', False)  # Record until stopped: headless, segmented, reconnecting
+        self.source = self  # Backend feeding acquire(); the DMM itself unless source names another backend
         self.dmm = None
-        self.data = {'timestamp': [], 'voltage': []}
-        self.csv_filename = ""
+        self.recorder = None
+        self.samples = None
+        self.buffer_chunk_size = config.get('buffer_chunk_size', 65536)  # Samples per preallocated chunk
+        self.buffer_max_chunks = config.get('buffer_max_chunks', 16)  # Chunks kept in memory
+        self.output_filename = ""
+        self.output_format = config.get('output_format', 'csv')  # 'csv', 'hdf5' or 'compact'
+        self.compact_quantum = config.get('compact_quantum')  # Volts per stored step; None uses resolution
+        self.compact_codec = config.get('compact_codec', 'zlib')  # 'zlib' or 'zstd'
+        self.compact_chunk_rows = config.get('compact_chunk_rows', 4096)  # Rows per compressed chunk
+        self.output_dir = config.get('output_dir', '.')
+        self.segment_interval = config.get('segment_interval') or (3600 if self.daemon else None)  # Seconds per segment
+        self.segment_max_bytes = config.get('segment_max_bytes')  # Also rotate once a segment file is this large
+        self.retention_full_days = config.get('retention_full_days')  # Then replace segments by downsampled means
+        self.retention_downsampled_days = config.get('retention_downsampled_days')  # Then delete them; None keeps them
+        self.downsample_period = config.get('downsample_period', 1.0)  # Seconds per mean; 0 deletes instead
+        self.resume = config.get('resume', False) or self.daemon  # Continue the last incomplete segmented session
+        self.catalog_db = config.get('catalog_db')  # SQLite catalog the finished session is added to
+        self.range = config.get('range', 10)  # Volts
+        self.nplc = config.get('nplc', 0.02)  # Minimum integration time for faster measurements
+        self.autozero = config.get('autozero', 'OFF')
+        self.resolution = config.get('resolution', 0.0001)
+        self.identity = {}
+        self.profile_cache = config.get('profile_cache', '.dmm_profile_cache.json')  # Applied profile per instrument
+        self.profile_mismatches = []  # Settings the instrument didn't accept at the last apply_profile()
+        self.driver = config.get('driver', 'qcodes')  # 'qcodes' or 'pyvisa' (raw SCPI, faster connect)
+        self.simulate = config.get('simulate', False)  # Use the software 34461A model instead of VISA
+        self.sim_latency = config.get('sim_latency', 0.002)  # Simulated seconds per VISA round trip
+        self.sim_noise = config.get('sim_noise', 2e-6)  # Simulated noise in volts RMS at NPLC 1
+        self.flush_interval = config.get('flush_interval', 1.0)  # Max seconds of data at risk on a crash
+        self.flush_rows = config.get('flush_rows', 1000)  # Flush early once this many rows are pending
+        self.recorder_queue_size = config.get('recorder_queue_size', 100)  # Blocks buffered for the writer
         self.log_file = config.get('log_file', 'dmm_test.log')
+        self.log_max_bytes = config.get('log_max_bytes') or (10 << 20 if self.daemon else None)  # Log rotation size
+        self.log_backups = config.get('log_backups', 5)  # Rotated logs kept
+        self.reconnect = config.get('reconnect')  # Reconnect after instrument errors; None follows daemon
+        self.reconnect_delay = config.get('reconnect_delay', 1.0)  # Seconds before the first retry, doubled each time
+        self.reconnect_max_delay = config.get('reconnect_max_delay', 60)  # Longest wait between retries
+        if self.reconnect is None:
+            self.reconnect = self.daemon
+        self.test_time = float('inf') if self.daemon else config.get('test_time', 9800)  # Seconds; daemons run until stopped
+        self.reconnects = 0
+        self.acquisition_mode = config.get('acquisition_mode', 'poll')  # 'poll' or 'burst'
+        self.burst_block_size = config.get('burst_block_size', 1000)  # Max readings drained per R? query
+        self.burst_poll_interval = config.get('burst_poll_interval', 0.1)  # Seconds between drains
+        self.binary_transfer = config.get('binary_transfer', True)  # REAL,64 instead of ASCII
+        self.burst_armed = False
+        self.plot_fps = config.get('plot_fps', 10)  # Plot frame rate, independent of the sample rate
+        self.plot_queue_size = config.get('plot_queue_size', 1000)  # Blocks buffered for the plot
+        self.plot_window = config.get('plot_window')  # Seconds shown while following; None for the whole session
+        self.plot = None
+        self.shared_ring = config.get('shared_ring')  # Shared-memory ring name for viewer.py; None disables it
+        self.shared_ring_size = config.get('shared_ring_size', 1 << 20)  # Samples held in the ring
+        self.ring = None
+        self.stream_port = config.get('stream_port')  # TCP port for sample_stream subscribers; None disables it
+        self.stream_host = config.get('stream_host', '127.0.0.1')  # '0.0.0.0' to accept other machines
+        self.stream_interval = config.get('stream_interval', 0.05)  # Seconds of samples batched per frame
+        self.publisher = None
+        self.headless = config.get('headless', False) or self.daemon  # No live plot; status on the console
+        self.status_interval = config.get('status_interval', 10)  # Seconds between headless status lines
+        self.launch_time = time.monotonic()
+        self.stats_windows = config.get('stats_windows', [10, 60])  # Seconds covered by the rolling min/max
+        self.ewma_time_constant = config.get('ewma_time_constant', 1.0)  # Seconds
+        self.settle_tolerance = config.get('settle_tolerance')  # Volts either side; None disables settling events
+        self.settle_time = config.get('settle_time', 30)  # Seconds inside the band before 'settled' fires
+        self.stats = None
+        self.first_sample_delay = None  # Seconds from construction to the first recorded sample
+        self.acquisition_thread = None
+        self.overrun_policy = config.get('overrun_policy', 'skip')  # 'skip' or 'catch_up' missed poll deadlines
+        self.scheduler = None
+        self.instrumentation = config.get('instrumentation', False)  # Per-stage timing of the acquisition loop
+        self.instrumentation_log_interval = config.get('instrumentation_log_interval', 60)  # Seconds between stage reports
+        self.timer = StageTimer(self.instrumentation_log_interval) if self.instrumentation else NullTimer()
+        self.stop_flag = threading.Event()
         
-        logging.basicConfig(filename=self.log_file, level=logging.INFO, 
+        if self.log_max_bytes:
+            from logging.handlers import RotatingFileHandler
+
+            handlers = [RotatingFileHandler(self.log_file, maxBytes=self.log_max_bytes, backupCount=self.log_backups)]
+        else:
+            handlers = [logging.FileHandler(self.log_file)]
+        logging.basicConfig(handlers=handlers, level=logging.INFO, 
                             format='%(asctime)s - %(levelname)s - %(message)s')
+        if self.daemon and not self.buffer_max_chunks:
+            logging.warning("Daemon mode needs a bounded sample buffer; using buffer_max_chunks: 16.")
+            self.buffer_max_chunks = 16
 
     @staticmethod
     def load_config(config_file):
@@ -30,35 +130,286 @@ class AgilentDMM:
 
     def setup_instrument(self):
         try:
-            self.dmm = Keysight34461A('dmm', self.visa_addr)
-            self.dmm.autorange_once()
-            self.dmm.trigger.source('IMM')
-            self.dmm.trigger.delay(0.0)
-            self.dmm.display.enabled(False)
-            self.dmm.range.set(10)  # 10 volts range
-            self.dmm.NPLC.set(0.02)  # Minimum integration time for faster measurements
-            self.dmm.autozero.set('OFF')
-            self.dmm.resolution.set(0.0001)
+            if self.source_type in self.SOURCES:
+                # Same recorder/plot pipeline, fed by the IVI driver, a sample-clocked DAQ channel or a recording
+                self.source = self.SOURCES[self.source_type](self.config)
+                self.source.setup_instrument()
+                self.identity = self.source.identity
+                logging.info("Instrument setup successfully.")
+                return
+            if self.simulate:
+                self.dmm = SimulatedKeysight34461A('dmm', self.visa_addr, self.sim_latency, self.sim_noise)
+            elif self.driver == 'pyvisa':
+                self.dmm = PyvisaKeysight34461A('dmm', self.visa_addr)
+            else:
+                from qcodes.instrument_drivers.Keysight import Keysight34461A
+
+                self.dmm = Keysight34461A('dmm', self.visa_addr)
+            self.identity = self.dmm.IDN()
+            self.apply_profile()
             logging.info("Instrument setup successfully.")
         except Exception as e:
             logging.error(f"Error initializing the instrument: {e}")
             raise
 
+    def connect(self, arm=None):
+        """setup_instrument() and then arm(), retried with exponential backoff; False if stopped first."""
+        delay = self.reconnect_delay
+        while True:
+            try:
+                self.setup_instrument()
+                if arm is not None:
+                    arm()
+                return True
+            except Exception as e:
+                logging.warning(f"Could not connect to the instrument ({e}); retrying in {delay:g} s.")
+            self.drop_connection()
+            if self.stop_flag.wait(delay):
+                return False
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def open_instrument(self):
+        """setup_instrument(), retried by connect() when `reconnect` is set; False if stopped before connecting."""
+        if self.reconnect:
+            return self.connect()  # The instrument may come up after we do
+        self.setup_instrument()
+        return True
+
+    def drop_connection(self):
+        """Forget a connection that may already be dead, without sending the instrument anything."""
+        source, dmm = self.source, self.dmm
+        self.source, self.dmm, self.burst_armed = self, None, False
+        try:
+            if source is not self:
+                source.close()
+            elif dmm is not None:
+                dmm.close()
+        except Exception as e:
+            logging.warning(f"Error closing the lost connection: {e}")
+            if hasattr(dmm, 'remove_instance'):
+                dmm.remove_instance(dmm)  # qcodes keeps the name 'dmm' taken until the instance is removed
+
+    def instrument_profile(self):
+        """Settings applied by setup_instrument, in the order PROFILE_QUERY reads them back."""
+        return {
+            'range': float(self.range),
+            'nplc': float(self.nplc),
+            'autozero': str(self.autozero).upper(),
+            'resolution': float(self.resolution),
+            'trigger_source': 'IMM',
+            'trigger_delay': 0.0,
+            'trigger_count': 1,
+            'sample_count': 1,  # A burst leaves SAMP:COUN raised, which would break single READ? polls
+            'display': 'OFF',
+            'data_format': 'ASC',  # start_burst leaves REAL,64 and SAMP:SOUR TIM, which READ? polls can't use
+            'sample_source': 'IMM',
+        }
+
+    @staticmethod
+    def profile_command(profile):
+        """
+        The whole profile as one compound SCPI message.
+
+        RES is not sent: the 34461A couples it to NPLC, and setting it would
+        move NPLC to whatever integration time that resolution needs.
+        """
+        return (f":FUNC \"VOLT:DC\";:VOLT:DC:RANG {profile['range']};:VOLT:DC:NPLC {profile['nplc']};"
+                f":VOLT:DC:ZERO:AUTO {profile['autozero']};"
+                f":TRIG:SOUR {profile['trigger_source']};:TRIG:DEL {profile['trigger_delay']};"
+                f":TRIG:COUN {profile['trigger_count']};:SAMP:COUN {profile['sample_count']};"
+                f":DISP {profile['display']};:FORM:DATA {profile['data_format']};:SAMP:SOUR {profile['sample_source']}")
+
+    def apply_profile(self):
+        """
+        Configure the instrument with one compound write and verify it with one readback.
+
+        The profile hash and the readback are cached per instrument. If a later
+        connection finds the same profile and the instrument still reports the
+        same state, configuration is skipped entirely. Returns True if the
+        instrument was reconfigured; settings it didn't accept are left in
+        `profile_mismatches`.
+        """
+        profile = self.instrument_profile()
+        profile_hash = hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()
+        key = f"{self.visa_addr}|{self.identity.get('serial', '')}"
+        cache = self._load_profile_cache()
+
+        state = self.dmm.ask(self.PROFILE_QUERY).strip()
+        cached = cache.get(key)
+        if cached is not None and cached['hash'] == profile_hash and cached['state'] == state:
+            logging.info(f"Instrument already configured with profile {profile_hash[:8]}, skipping setup.")
+            self.profile_mismatches = []
+            return False
+
+        self.dmm.write(self.profile_command(profile))
+        state = self.dmm.ask(self.PROFILE_QUERY).strip()
+        mismatches = self.profile_mismatches = self._profile_mismatches(profile, state)
+        if mismatches:
+            # Don't cache a state we didn't ask for; the next connection will try again
+            logging.warning(f"Instrument did not accept profile: {', '.join(mismatches)}")
+            cache.pop(key, None)
+        else:
+            cache[key] = {'hash': profile_hash, 'state': state}
+        self._save_profile_cache(cache)
+        logging.info(f"Instrument configured with profile {profile_hash[:8]}.")
+        return True
+
+    @staticmethod
+    def _profile_mismatches(profile, state):
+        """Compare a PROFILE_QUERY response against the requested profile."""
+        values = state.split(';')
+        if len(values) != len(profile):
+            return [f"unexpected readback {state!r}"]
+        mismatches = []
+        for (name, wanted), value in zip(profile.items(), values):
+            value = value.strip().strip('"').split(',')[0]  # FORM:DATA? answers e.g. 'ASC,9'
+            if name == 'resolution':
+                continue  # Follows NPLC on the instrument
+            if isinstance(wanted, (int, float)):
+                ok = abs(float(value) - wanted) <= 1e-9 + 1e-6 * abs(wanted)
+            else:
+                ok = value.upper() in (wanted, {'OFF': '0', 'ON': '1'}.get(wanted))
+            if not ok:
+                mismatches.append(f"{name}={value} (wanted {wanted})")
+        return mismatches
+
+    def _load_profile_cache(self):
+        try:
+            with open(self.profile_cache, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_profile_cache(self, cache):
+        try:
+            with open(self.profile_cache, 'w') as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Could not write profile cache {self.profile_cache}: {e}")
+
+    def start_burst(self, measurement_frequency, sample_count):
+        """Arm a timer-paced burst that fills the instrument's reading memory."""
+        sample_count = int(min(sample_count, self.BURST_MAX_SAMPLES))
+        self.dmm.write('FORM:DATA REAL,64' if self.binary_transfer else 'FORM:DATA ASC')
+        self.dmm.write('FORM:BORD NORM')  # Big-endian doubles
+        self.dmm.write('TRIG:COUN 1')
+        self.dmm.write('SAMP:SOUR TIM')
+        self.dmm.write(f'SAMP:TIM {1 / measurement_frequency}')
+        self.dmm.write(f'SAMP:COUN {sample_count}')
+        # The instrument coerces the timer to its own resolution, so use its value for timestamps
+        self.sample_interval = float(self.dmm.ask('SAMP:TIM?'))
+        self.dmm.write('INIT')
+        self.burst_start = time.monotonic()
+        self.burst_index = 0
+        self.burst_count = sample_count
+        self.burst_armed = True
+        logging.info(f"Burst armed: {sample_count} samples every {self.sample_interval} s.")
+
+    def fetch_burst(self, n=None):
+        """Drain up to n readings from the instrument memory and reconstruct their timestamps."""
+        available = int(float(self.dmm.ask('DATA:POIN?')))
+        if available == 0:
+            return np.empty(0), np.empty(0)
+        if available >= self.READING_MEMORY:
+            logging.warning("Reading memory full; drain more often (burst_poll_interval) or readings are lost.")
+        count = min(available, n or self.burst_block_size, self.READING_MEMORY)
+        if self.binary_transfer:
+            readings = self.dmm.visa_handle.query_binary_values(
+                f'R? {count}', datatype='d', is_big_endian=True, container=np.array)
+        else:
+            readings = self._parse_ascii_block(self.dmm.ask(f'R? {count}'))
+
+        first = self.burst_index
+        self.burst_index += len(readings)
+        timestamps = self.burst_start + (first + np.arange(len(readings))) * self.sample_interval
+        return timestamps, readings
+
+    def stop_burst(self):
+        """Abort a running burst, return whatever is still in reading memory and restore the poll settings."""
+        if not self.burst_armed:
+            return np.empty(0), np.empty(0)
+        self.dmm.write('ABOR')
+        timestamps, readings = [], []
+        while True:
+            block_times, block_readings = self.fetch_burst()
+            if len(block_readings) == 0:
+                break
+            timestamps.append(block_times)
+            readings.append(block_readings)
+        self.dmm.write(self.POLL_STATE)
+        self.burst_armed = False
+        if not readings:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(timestamps), np.concatenate(readings)
+
+    @staticmethod
+    def _parse_ascii_block(response):
+        """Parse an IEEE 488.2 definite-length block of comma separated readings."""
+        response = response.strip()
+        if response.startswith('#'):
+            digits = int(response[1])
+            response = response[2 + digits:]
+        return np.array([float(value) for value in response.split(',') if value])
+
+    def session_metadata(self, measurement_frequency):
+        """Instrument identity and settings stored alongside the samples."""
+        metadata = {f'instrument_{key}': value for key, value in self.identity.items()}
+        metadata.update({
+            'visa_addr': self.visa_addr,
+            'start_time': datetime.fromtimestamp(self.samples.wall_anchor).isoformat(),
+            'range': self.range,
+            'nplc': self.nplc,
+            'autozero': self.autozero,
+            'resolution': self.resolution,
+            'measurement_frequency': measurement_frequency,
+            'acquisition_mode': self.acquisition_mode,
+            'settle_tolerance': self.settle_tolerance,
+            'settle_time': self.settle_time,
+        })
+        if self.output_format == 'compact':
+            metadata.update({'quantum': self.compact_quantum or self.resolution, 'codec': self.compact_codec,
+                             'chunk_rows': self.compact_chunk_rows})
+        return metadata
+
     def save_data(self):
-        """Function to save data to CSV."""
-        df = pd.DataFrame(self.data)
-        df.to_csv(self.csv_filename, index=False)
-        logging.info(f"Data saved to {self.csv_filename}")
+        """Write out any buffered rows and close the output file."""
+        if self.recorder is not None:
+            self.recorder.close()
+            if self.catalog_db:
+                self.add_to_catalog()
+        if self.ring is not None:
+            self.ring.close()  # Attached viewers see the ring closed and exit
+            self.ring = None
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        if self.stats is not None and self.stats.count:
+            summary = ', '.join(f"{key}={value:.7g}" if isinstance(value, float) else f"{key}={value}"
+                                for key, value in self.stats.summary().items())
+            logging.info(f"Session statistics: {summary}")
+
+    def add_to_catalog(self):
+        """Index the session's output directory so the new session shows up in catalog queries."""
+        from catalog import Catalog
+
+        catalog = Catalog(self.catalog_db)
+        try:
+            catalog.scan(os.path.dirname(self.output_filename) or '.')
+        except Exception as e:
+            logging.error(f"Could not update the catalog {self.catalog_db}: {e}")
+        finally:
+            catalog.close()
 
     def handle_exit(self, signum=None, frame=None):
         """Handle exit signal to save data and close connection."""
         logging.info("Process interrupted, saving data and closing connections...")
+        self.stop_flag.set()  # Ensure the threads stop
+        if self.acquisition_thread is not None and self.acquisition_thread is not threading.current_thread():
+            self.acquisition_thread.join(timeout=5)
         self.save_data()
-        if self.dmm is not None:
-            self.dmm.close()
-            logging.info("Connection to DMM closed.")
-        self.stop_flag.set()  # Ensure the thread stops
-        plt.close('all')  # Close the plot
+        self.close()
+        if self.plot is not None:
+            self.plot.close()  # Close the plot
         logging.info("Exiting gracefully.")
         exit(0)
 
@@ -67,51 +418,195 @@ class AgilentDMM:
         input("Press Enter to stop the test...\n")
         self.stop_flag.set()
 
+    def start_acquisition(self, measurement_frequency, test_time):
+        """Arm the instrument for the configured mode and return the scheduler pacing read_block()."""
+        if self.acquisition_mode == 'burst':
+            # The instrument paces the samples; we only pace the drains
+            self.start_burst(measurement_frequency, measurement_frequency * test_time)
+            return DeadlineScheduler(1 / self.burst_poll_interval, 'skip')
+        return DeadlineScheduler(measurement_frequency, self.overrun_policy)
+
+    def read_block(self, n=None):
+        """One polled reading, or up to n readings buffered since the last call in burst mode."""
+        if self.acquisition_mode == 'burst':
+            timestamps, readings = self.fetch_burst(n)
+            if self.burst_index >= self.burst_count:
+                self.start_burst(1 / self.sample_interval, self.BURST_MAX_SAMPLES)
+            return timestamps, readings
+        volts = float(self.dmm.volt())
+        return (time.monotonic(),), (volts,)
+
+    def stop_acquisition(self):
+        """Stop the instrument and return any readings it still holds."""
+        return self.stop_burst()
+
+    def acquire(self, measurement_frequency, test_time, start_time):
+        """Acquisition loop, run on its own thread so rendering never delays a reading."""
+        def arm():
+            self.scheduler = self.source.start_acquisition(measurement_frequency, test_time)
+            self.scheduler.start()
+
+        def recover(error):
+            """Reconnect and re-arm after an instrument error; False if stopped first."""
+            # Same sample buffer and recorder, so the session just shows a gap
+            logging.error(f"Lost the instrument: {error}")
+            self.drop_connection()
+            if self.stop_flag.wait(self.reconnect_delay) or not self.connect(arm):
+                return False
+            self.reconnects += 1
+            logging.info(f"Reconnected to the instrument ({self.reconnects} reconnects this session).")
+            return True
+
+        timer = self.timer
+        try:
+            # Inside the try, so a failure to arm still sets stop_flag and releases the main thread
+            try:
+                arm()
+            except Exception as e:
+                if not self.reconnect:
+                    raise
+                if not recover(e):
+                    return
+            while (not self.stop_flag.is_set() and not self.source.finished
+                   and time.monotonic() - start_time < test_time):
+                t = timer.start()
+                try:
+                    block = self.source.read_block()
+                except Exception as e:
+                    if not self.reconnect:
+                        raise
+                    if not recover(e):
+                        break
+                    continue
+                timer.lap('read', t)
+                self.record(*block)
+                t = timer.start()
+                self.scheduler.wait(self.stop_flag)
+                timer.lap('sleep', t)
+                timer.maybe_log()
+
+            self.record(*self.source.stop_acquisition())
+            self.log_timing_report(start_time)
+
+        except Exception as e:
+            logging.error(f"An error occurred during the test: {e}")
+
+        finally:
+            self.stop_flag.set()
+
+    def log_timing_report(self, start_time):
+        """Log achieved sample rate and scheduling jitter for the run."""
+        elapsed = time.monotonic() - start_time
+        report = self.scheduler.report()
+        logging.info(
+            f"Achieved {len(self.samples) / elapsed:.2f} samples/s over {elapsed:.1f} s "
+            f"({report['ticks']} ticks at {report['achieved_rate']:.2f}/s of {report['target_rate']:.2f}/s target, "
+            f"{report['skipped']} skipped). Lateness p50/p95/p99/max: "
+            f"{report['lateness_p50_ms']:.2f}/{report['lateness_p95_ms']:.2f}/"
+            f"{report['lateness_p99_ms']:.2f}/{report['lateness_max_ms']:.2f} ms")
+        self.timer.log_report()
+        return report
+
+    def record(self, timestamps, readings):
+        """Append a block to the sample buffer and hand views of it to the recorder and plot."""
+        if self.first_sample_delay is None and len(readings):
+            self.first_sample_delay = time.monotonic() - self.launch_time
+            logging.info(f"First sample recorded {self.first_sample_delay:.3f} s after start-up.")
+        timer = self.timer
+        t = timer.start()
+        start, stop = self.samples.extend(timestamps, readings)
+        t = timer.lap('buffer', t)
+        index = start
+        for times, voltages in self.samples.segments(start, stop):
+            self.recorder.write(times, voltages)
+            t = timer.lap('recorder', t)
+            if self.plot is not None:
+                self.plot.publish(times, voltages)
+                t = timer.lap('plot', t)
+            if self.ring is not None:
+                self.ring.write(times, voltages)
+                t = timer.lap('ring', t)
+            if self.publisher is not None:
+                self.publisher.publish(index, times, voltages)
+                t = timer.lap('stream', t)
+            index += len(voltages)
+
+    def start_session(self, measurement_frequency):
+        """Create the sample buffer and start the recorder; returns the monotonic start time."""
+        self.samples = SampleBuffer(self.buffer_chunk_size, self.buffer_max_chunks)
+        start_datetime = datetime.fromtimestamp(self.samples.wall_anchor).strftime("%Y-%m-%d_%H-%M-%S")
+        recorder_class, extension = RECORDERS[self.output_format]
+        resume_dir = find_incomplete(self.output_dir) if self.resume else None
+        if self.resume and resume_dir is None:
+            logging.info("No incomplete session to resume, starting a new one.")
+        if resume_dir is not None:
+            # Keep the session's own format, whatever output_format says now
+            extension = read_manifest(resume_dir)['extension']
+            recorder_class = next(cls for cls, ext in RECORDERS.values() if ext == extension)
+            self.output_filename = resume_dir
+        elif self.segment_interval:
+            self.output_filename = os.path.join(self.output_dir, f"PDMS_Test_{start_datetime}")
+        else:
+            self.output_filename = os.path.join(self.output_dir, f"PDMS_Test_{start_datetime}{extension}")
+        metadata = self.session_metadata(measurement_frequency)
+        if resume_dir is not None or self.segment_interval:
+            retention = None
+            if self.retention_full_days is not None or self.retention_downsampled_days is not None:
+                retention = {'full_age': None if self.retention_full_days is None else self.retention_full_days * 86400,
+                             'downsampled_age': (None if self.retention_downsampled_days is None
+                                                 else self.retention_downsampled_days * 86400),
+                             'period': self.downsample_period}
+            self.recorder = SegmentedRecorder(self.output_filename, self.samples, recorder_class, extension,
+                                              self.segment_interval or 3600, self.flush_interval, self.flush_rows,
+                                              self.recorder_queue_size, metadata, resume=resume_dir is not None,
+                                              max_bytes=self.segment_max_bytes, retention=retention)
+        else:
+            self.recorder = recorder_class(self.output_filename, self.samples, self.flush_interval, self.flush_rows,
+                                           self.recorder_queue_size, metadata)
+        self.recorder.timer = self.timer
+        self.stats = OnlineStats(self.stats_windows, self.ewma_time_constant, self.settle_tolerance, self.settle_time)
+        self.recorder.stats = self.stats
+        if self.shared_ring:
+            self.ring = SharedRing.create(self.shared_ring, self.shared_ring_size,
+                                          (self.samples.wall_anchor, self.samples.mono_anchor))
+            logging.info(f"Publishing samples to shared ring '{self.shared_ring}'.")
+        if self.stream_port is not None:
+            self.publisher = SamplePublisher(self.samples, self.stream_host, self.stream_port, self.stream_interval)
+            self.publisher.start()
+        self.recorder.start()
+        self.stop_flag = threading.Event()
+        return self.samples.mono_anchor
+
     def run_test(self, measurement_frequency, test_time, max_points=100):
-        if self.dmm is None:
+        if self.dmm is None and self.source is self:
             raise ValueError("Instrument not initialized. Call setup_instrument() first.")
-        
-        sleep_interval = 1 / measurement_frequency
-
-        plt.ion()  # Turn on interactive mode
-        fig, ax = plt.subplots()
-        line, = ax.plot([], [], 'b-', label='Voltage (V)')
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Voltage (V)')
-        ax.set_title('Live Voltage Measurement')
-        ax.grid(True)
-        ax.legend()
-
-        times = deque(maxlen=max_points)
-        voltages = deque(maxlen=max_points)
-
-        start_time = time.time()
-        start_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.csv_filename = f"PDMS_Test_{start_datetime}.csv"
+
+        if not self.headless:
+            from live_plot import LivePlot  # matplotlib is only loaded when there is a plot to show
+
+            self.plot = LivePlot(max_points, self.plot_fps, self.plot_queue_size, self.plot_window)
+            self.plot.timer = self.timer
+        start_time = self.start_session(measurement_frequency)
         
         signal.signal(signal.SIGINT, self.handle_exit)
         signal.signal(signal.SIGTERM, self.handle_exit)
 
-        self.stop_flag = threading.Event()
-        input_thread = threading.Thread(target=self.wait_for_user_input)
-        input_thread.start()
+        if not self.headless or (sys.stdin is not None and sys.stdin.isatty()):
+            # Under a service manager there is no console to press Enter on
+            input_thread = threading.Thread(target=self.wait_for_user_input, daemon=True)
+            input_thread.start()
+
+        self.acquisition_thread = threading.Thread(
+            target=self.acquire, args=(measurement_frequency, test_time, start_time), name='acquisition')
+        self.acquisition_thread.start()
 
         try:
-            while not self.stop_flag.is_set() and time.time() - start_time < test_time:
-                volts = float(self.dmm.volt())
-                current_time = time.time()
-
-                voltages.append(volts)
-                times.append(current_time - start_time)  # Relative time
-                self.data['timestamp'].append(datetime.fromtimestamp(current_time).strftime("%Y-%m-%d %H:%M:%S.%f"))
-                self.data['voltage'].append(volts)
-                
-                line.set_data(times, voltages)
-                ax.relim()
-                ax.autoscale_view()
-                fig.canvas.draw()
-                fig.canvas.flush_events()
-                time.sleep(sleep_interval)
+            if self.headless:
+                self.report_status(start_time)
+            else:
+                # The GUI has to live on the main thread; it only consumes what the producer queued
+                self.plot.open(start_time)
+                self.plot.run(self.stop_flag)
 
         except Exception as e:
             logging.error(f"An error occurred during the test: {e}")
@@ -119,29 +614,71 @@ class AgilentDMM:
         finally:
             self.handle_exit()
 
+    def report_status(self, start_time):
+        """Print a status line every status_interval seconds until the test stops."""
+        while True:
+            stopped = self.stop_flag.wait(self.status_interval)
+            count = len(self.samples)
+            elapsed = time.monotonic() - start_time
+            status = f"{elapsed:9.1f} s  {count} samples  {count / elapsed:.2f} samples/s"
+            if count:
+                status += f"  last {self.samples[count - 1:count][1][0]:.7g} V"
+            summary = self.stats.summary()
+            if summary['count']:
+                status += f"  ewma {summary['ewma']:.7g} V"
+            if summary.get('settled'):
+                status += "  settled"
+            if self.reconnects:
+                status += f"  {self.reconnects} reconnects"
+            print(status, flush=True)
+            if stopped:
+                return
+
     def close(self):
-        if self.dmm is not None:
+        if self.source is not self:
+            self.source.close()
+            self.source = self
+        elif self.dmm is not None:
+            if self.burst_armed:
+                self.dmm.write(f'ABOR;{self.POLL_STATE}')
+                self.burst_armed = False
             self.dmm.close()
+            self.dmm = None
             logging.info("Connection to DMM closed.")
-        else:
-            logging.warning("Instrument already closed or not initialized.")
+        # Otherwise already closed (handle_exit and main() both close); nothing to do
 
 def main():
     parser = argparse.ArgumentParser(description="Run voltage measurement test with Agilent DMM.")
     parser.add_argument('--config', type=str, default='config.yaml', help="Path to the configuration file.")
+    parser.add_argument('--headless', action='store_true', help="Record without the live plot; print status instead.")
+    parser.add_argument('--resume', action='store_true', help="Continue the last incomplete segmented session.")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Record until stopped, with rotation, retention and reconnects (implies --headless).")
+    parser.add_argument('--replay', type=str, help="Feed this recorded session through the pipeline instead of the DMM.")
+    parser.add_argument('--speed', type=float, help="Replay speed: 1 real time, N times faster, 0 as fast as possible.")
     args = parser.parse_args()
 
     config = AgilentDMM.load_config(args.config)
+    if args.headless:
+        config['headless'] = True
+    if args.resume:
+        config['resume'] = True
+    if args.daemon:
+        config['daemon'] = True
+    if args.replay:
+        config['source'] = 'replay'
+        config['replay_file'] = args.replay
+    if args.speed is not None:
+        config['replay_speed'] = args.speed
 
     dmm = AgilentDMM(config)
 
     try:
-        dmm.setup_instrument()
+        dmm.open_instrument()
         measurement_frequency = config.get('measurement_frequency', 10)  # Default to 10 Hz
-        test_time = config.get('test_time', 9800)  # Default to 9800 seconds
         max_points = config.get('max_points', 100)  # Default to 100 points
 
-        dmm.run_test(measurement_frequency, test_time, max_points)
+        dmm.run_test(measurement_frequency, dmm.test_time, max_points)
 
     except Exception as e:
         logging.error(f"Failed to perform measurements: {e}")
@@ -0,0 +1,278 @@
+"""
+Post-run analysis of PDMS session files.
+
+Each session (PDMS_Test_*.csv, HDF5 or compact session file, or segmented
+session directory) is streamed in chunks of `chunk_rows` samples, so memory depends
+on the chunk size and the length of the resampled series, not on the length
+of the recording. CSV chunks are read with fixed column types and their
+timestamps go through session_file.parse_timestamps, numpy's vectorized
+ISO 8601 parser; nothing is inferred per row.
+
+For every session it produces:
+    - a series resampled to `period` seconds: per-bin count, mean, std,
+      min, max, and a rolling mean/std over the last `window` seconds
+    - one row per segment (a stretch without a gap longer than `gap`
+      seconds): time span, mean/std/min/max, drift as the least-squares
+      slope in V/hour, and the settling time, after which the resampled
+      series stays within +/- `tolerance` of the segment's final level
+
+Sessions are analysed in parallel in a process pool; each worker writes its
+resampled series and returns only the segment rows.
+
+Usage:
+    python analysis.py ../PDMS_Tests/*.csv --out analysis --workers 4
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+
+SEGMENT_COLUMNS = ['session', 'segment', 'start', 'end', 'duration_s', 'samples', 'mean', 'std', 'min', 'max',
+                   'drift_v_per_h', 'settling_time_s', 'final_level']
+
+
+def iter_chunks(path, chunk_rows=65536, rows=None):
+    """
+    (epoch times, voltages) of a session, chunk_rows samples at a time (compact
+    files: a stored chunk at a time). `rows` stops a single file after that
+    many samples, e.g. the rows a segment's manifest entry vouches for.
+    """
+    if os.path.isdir(path):
+        from segments import read_manifest
+
+        for segment in read_manifest(path)['segments']:
+            filename = os.path.join(path, segment['file'])
+            if segment['rows'] and os.path.exists(filename):
+                yield from _file_chunks(filename, chunk_rows, segment['rows'])
+    else:
+        yield from _file_chunks(path, chunk_rows, rows)
+
+
+def _file_chunks(filename, chunk_rows, rows=None):
+    if filename.endswith('.csv'):
+        import pandas as pd
+        from session_file import parse_timestamps
+
+        reader = pd.read_csv(filename, chunksize=chunk_rows, nrows=rows, dtype={'timestamp': str, 'voltage': float})
+        for chunk in reader:
+            yield parse_timestamps(chunk['timestamp'].to_numpy()), chunk['voltage'].to_numpy()
+    elif filename.endswith('.dmmz'):
+        from compact_file import iter_compact
+
+        for times, voltages in iter_compact(filename):
+            if rows is not None:
+                if rows <= 0:
+                    return
+                times, voltages = times[:rows], voltages[:rows]
+                rows -= len(times)
+            yield times, voltages
+    else:
+        import h5py
+
+        with h5py.File(filename, 'r') as f:
+            total = min(f['time'].shape[0], f['voltage'].shape[0])
+            if rows is not None:
+                total = min(total, rows)
+            for first in range(0, total, chunk_rows):
+                last = min(first + chunk_rows, total)
+                yield f['time'][first:last], f['voltage'][first:last]
+
+
+class _Segment:
+    """Running moments of one segment; chunks are merged with Chan's pairwise update."""
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.n = 0
+        self.mean_t = self.mean_v = 0.0
+        self.ctt = self.ctv = self.cvv = 0.0  # Co-moments of (t - start, v)
+        self.low = np.inf
+        self.high = -np.inf
+
+    def update(self, times, voltages):
+        t = times - self.start
+        n = len(t)
+        mean_t, mean_v = t.mean(), voltages.mean()
+        dt, dv = t - mean_t, voltages - mean_v
+        ctt, ctv, cvv = dt @ dt, dt @ dv, dv @ dv
+        total = self.n + n
+        delta_t, delta_v = mean_t - self.mean_t, mean_v - self.mean_v
+        weight = self.n * n / total
+        self.ctt += ctt + delta_t * delta_t * weight
+        self.ctv += ctv + delta_t * delta_v * weight
+        self.cvv += cvv + delta_v * delta_v * weight
+        self.mean_t += delta_t * n / total
+        self.mean_v += delta_v * n / total
+        self.n = total
+        self.end = float(times[-1])
+        self.low = min(self.low, float(voltages.min()))
+        self.high = max(self.high, float(voltages.max()))
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.cvv / self.n)) if self.n else np.nan
+
+    @property
+    def drift(self):
+        """Least-squares slope in volts per hour."""
+        return self.ctv / self.ctt * 3600 if self.ctt > 0 else np.nan
+
+
+class Resampler:
+    """Per-bin count, sum, sum of squares, min and max, appended chunk by chunk."""
+
+    def __init__(self, period):
+        self.period = period
+        self.origin = None
+        self.shift = 0.0  # Sums are taken around the first reading so the variance doesn't cancel out
+        self.columns = []  # (bins, count, sum, sumsq, min, max) per chunk
+
+    def update(self, times, voltages):
+        if self.origin is None:
+            self.origin = np.floor(times[0] / self.period) * self.period
+            self.shift = float(voltages[0])
+        bins = np.floor((times - self.origin) / self.period).astype(np.int64)
+        voltages = voltages - self.shift
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+        column = (bins[starts], np.diff(np.append(starts, len(bins))), np.add.reduceat(voltages, starts),
+                  np.add.reduceat(voltages * voltages, starts), np.minimum.reduceat(voltages, starts) + self.shift,
+                  np.maximum.reduceat(voltages, starts) + self.shift)
+        if self.columns and self.columns[-1][0][-1] == column[0][0]:
+            # First bin continues the last bin of the previous chunk
+            last = self.columns[-1]
+            last[1][-1] += column[1][0]
+            last[2][-1] += column[2][0]
+            last[3][-1] += column[3][0]
+            last[4][-1] = min(last[4][-1], column[4][0])
+            last[5][-1] = max(last[5][-1], column[5][0])
+            column = tuple(values[1:] for values in column)
+        if len(column[0]):
+            self.columns.append(column)
+
+    def series(self, window):
+        """Resampled series as a dict of arrays, with a rolling mean/std over `window` seconds."""
+        if not self.columns:
+            return {name: np.empty(0) for name in ('time', 'count', 'mean', 'std', 'min', 'max',
+                                                   'rolling_mean', 'rolling_std')}
+        bins, count, total, squares, low, high = (np.concatenate(values) for values in zip(*self.columns))
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+        # Window in bins, measured in time so gaps in the recording shorten it rather than stretch it
+        width = max(1, int(round(window / self.period)))
+        first = np.searchsorted(bins, bins - width + 1)
+        cumulative = [np.concatenate(([0], np.cumsum(values))) for values in (count, total, squares)]
+        window_count, window_total, window_squares = (c[1:] - c[first] for c in cumulative)
+        rolling_mean = window_total / window_count
+        rolling_std = np.sqrt(np.maximum(window_squares / window_count - rolling_mean * rolling_mean, 0.0))
+        return {'time': self.origin + bins * self.period, 'count': count, 'mean': mean + self.shift, 'std': std,
+                'min': low, 'max': high, 'rolling_mean': rolling_mean + self.shift, 'rolling_std': rolling_std}
+
+
+def settling_time(series, period, start, end, tolerance, settle_window):
+    """
+    Seconds from `start` until the resampled means stay within +/- tolerance
+    of the level over the segment's last `settle_window` seconds, and that level.
+    """
+    inside = (series['time'] + period > start) & (series['time'] <= end)
+    times, means, counts = series['time'][inside], series['mean'][inside], series['count'][inside]
+    if not len(times):
+        return np.nan, np.nan
+    tail = times >= times[-1] - settle_window
+    final = float(np.average(means[tail], weights=counts[tail]))
+    outside = np.flatnonzero(np.abs(means - final) > tolerance)
+    if not len(outside):
+        return 0.0, final
+    if outside[-1] == len(times) - 1:
+        return np.nan, final  # Still moving at the end of the segment
+    return max(0.0, float(times[outside[-1] + 1] - start)), final
+
+
+def analyze_session(path, period=1.0, window=60.0, gap=5.0, tolerance=0.0005, settle_window=60.0,
+                    chunk_rows=65536, out_dir=None):
+    """Stream one session; returns its segment rows and writes the resampled series to out_dir."""
+    resampler = Resampler(period)
+    segments = []
+    last_time = None
+    for times, voltages in iter_chunks(path, chunk_rows):
+        if not len(times):
+            continue
+        resampler.update(times, voltages)
+        breaks = np.flatnonzero(np.diff(times) > gap) + 1
+        if last_time is None or times[0] - last_time > gap:
+            breaks = np.concatenate(([0], breaks))
+        for first, last in zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(times)]))):
+            if first == last:
+                continue
+            if first in breaks:
+                segments.append(_Segment(float(times[first])))
+            segments[-1].update(times[first:last], voltages[first:last])
+        last_time = float(times[-1])
+
+    series = resampler.series(window)
+    name = os.path.basename(os.path.normpath(path))
+    if out_dir is not None:
+        _write_series(os.path.join(out_dir, f"{os.path.splitext(name)[0]}.resampled.csv"), series)
+
+    rows = []
+    for number, segment in enumerate(segments):
+        settle, final = settling_time(series, period, segment.start, segment.end, tolerance, settle_window)
+        rows.append([name, number, _format_time(segment.start), _format_time(segment.end),
+                     segment.end - segment.start, segment.n, segment.mean_v, segment.std, segment.low,
+                     segment.high, segment.drift, settle, final])
+    return rows
+
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _write_series(filename, series):
+    columns = list(series)
+    table = np.column_stack([series[column] for column in columns])
+    fmt = ['%.6f' if column == 'time' else '%.10g' for column in columns]
+    np.savetxt(filename, table, delimiter=',', header=','.join(columns), comments='', fmt=fmt)
+
+
+def analyze_sessions(paths, workers=None, **options):
+    """Analyse sessions in parallel; returns all segment rows in the order of `paths`."""
+    if workers == 1 or len(paths) == 1:
+        results = [analyze_session(path, **options) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(analyze_session, path, **options) for path in paths]
+            results = [future.result() for future in futures]
+    return [row for rows in results for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample and summarise PDMS session files.")
+    parser.add_argument('sessions', nargs='+', help="CSV, HDF5 or compact session files, or segmented session directories.")
+    parser.add_argument('--out', type=str, default='analysis', help="Directory for the resampled series and summary.")
+    parser.add_argument('--period', type=float, default=1.0, help="Resampling period in seconds.")
+    parser.add_argument('--window', type=float, default=60.0, help="Rolling statistics window in seconds.")
+    parser.add_argument('--gap', type=float, default=5.0, help="A pause longer than this starts a new segment.")
+    parser.add_argument('--tolerance', type=float, default=0.0005, help="Settling band in volts either side.")
+    parser.add_argument('--settle-window', type=float, default=60.0,
+                        help="Seconds at the end of a segment that define its final level.")
+    parser.add_argument('--chunk-rows', type=int, default=65536, help="Samples read per chunk.")
+    parser.add_argument('--workers', type=int, help="Worker processes; defaults to the CPU count.")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    rows = analyze_sessions(args.sessions, args.workers, period=args.period, window=args.window, gap=args.gap,
+                            tolerance=args.tolerance, settle_window=args.settle_window,
+                            chunk_rows=args.chunk_rows, out_dir=args.out)
+
+    import pandas as pd
+
+    summary = pd.DataFrame(rows, columns=SEGMENT_COLUMNS)
+    summary.to_csv(os.path.join(args.out, 'summary.csv'), index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(summary.drop(columns=['end']).to_string(index=False, float_format=lambda x: f'{x:.6g}'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Pick the most precise NPLC / resolution / autozero profile that still sustains
+the configured measurement_frequency.
+
+Every integration time the instrument's model supports is applied in turn, a
+short acquisition is run through the normal read path (poll or burst, as
+configured) and the achieved rate and noise floor are measured. Candidates whose nominal
+measurement time already exceeds the sample period are skipped without being
+measured, and so are candidates the instrument doesn't confirm on readback.
+The winner is written back into the config file, keeping its comments and
+layout.
+
+Noise is measured on whatever the DMM is connected to, so short the input or
+connect a stable source while tuning. It is taken from successive differences
+so slow drift of the input doesn't count, and never reported below the
+quantization step of the resolution.
+
+Usage:
+    python autotune.py --config config.yaml --duration 2
+"""
+
+import re
+import time
+import logging
+import argparse
+import numpy as np
+from agilent_dmm import AgilentDMM
+from dmm_models import resolution_table
+
+
+def candidates(measurement_frequency, line_frequency=60.0, nplc_steps=tuple(resolution_table())):
+    """(nplc, autozero) pairs from most to least precise whose integration fits in a sample period."""
+    period = 1 / measurement_frequency
+    for nplc in sorted(nplc_steps, reverse=True):
+        for autozero in ('ON', 'OFF'):
+            # Autozero takes a second zero reading per sample
+            if nplc / line_frequency * (2 if autozero == 'ON' else 1) < period:
+                yield nplc, autozero
+
+
+def measure(dmm, measurement_frequency, duration):
+    """Run one short acquisition; returns (achieved rate in Hz, noise in volts RMS, samples)."""
+    scheduler = dmm.start_acquisition(measurement_frequency, duration)
+    scheduler.start()
+    blocks = []
+    started = time.monotonic()
+    while time.monotonic() - started < duration:
+        blocks.append(np.asarray(dmm.read_block()[1], dtype=np.float64))
+        scheduler.wait()
+    blocks.append(np.asarray(dmm.stop_acquisition()[1], dtype=np.float64))
+    elapsed = time.monotonic() - started
+    readings = np.concatenate(blocks)
+    noise = np.std(np.diff(readings)) / np.sqrt(2) if len(readings) > 2 else np.inf
+    # Readings can't resolve noise below the quantization step
+    noise = float(np.hypot(noise, dmm.resolution / np.sqrt(12)))
+    return len(readings) / elapsed, noise, len(readings)
+
+
+def tune(dmm, measurement_frequency, duration=2.0, rate_tolerance=0.02, noise_tolerance=0.1, line_frequency=60.0):
+    """
+    Sweep the candidates on a connected AgilentDMM and return (best, results).
+
+    best is the first candidate, in order of nominal precision, that reaches
+    the target rate within rate_tolerance and whose noise is within
+    noise_tolerance of the quietest candidate that reaches it. If none does,
+    best is the fastest one measured.
+    """
+    # Only the NPLC values this model supports; others would be coerced and mislabelled
+    table = resolution_table(dmm.identity.get('model'))
+    results = []
+    for nplc, autozero in candidates(measurement_frequency, line_frequency, tuple(table)):
+        dmm.nplc = nplc
+        dmm.autozero = autozero
+        dmm.resolution = float(f'{dmm.range * table[nplc]:.3g}')
+        dmm.apply_profile()
+        if dmm.profile_mismatches:
+            logging.warning(f"Skipping NPLC {nplc} autozero {autozero}: {', '.join(dmm.profile_mismatches)}")
+            continue
+        rate, noise, count = measure(dmm, measurement_frequency, duration)
+        result = {'nplc': nplc, 'autozero': autozero, 'resolution': dmm.resolution,
+                  'rate': rate, 'noise': noise, 'samples': count,
+                  'sustained': rate >= measurement_frequency * (1 - rate_tolerance)}
+        logging.info(f"Tuning NPLC {nplc} autozero {autozero}: {rate:.2f} Hz, {noise:.3g} V RMS")
+        results.append(result)
+
+    sustained = [result for result in results if result['sustained']]
+    if not sustained:
+        logging.warning(f"No profile sustained {measurement_frequency} Hz; using the fastest.")
+        return (max(results, key=lambda result: result['rate']) if results else None), results
+    quietest = min(result['noise'] for result in sustained)
+    best = next(result for result in sustained if result['noise'] <= quietest * (1 + noise_tolerance))
+    return best, results
+
+
+def write_profile(config_file, profile):
+    """Set keys in a YAML config file in place, keeping its comments; missing keys are appended."""
+    with open(config_file, 'r') as f:
+        text = f.read()
+    for key, value in profile.items():
+        if isinstance(value, str):
+            line = f'{key}: "{value}"'
+        else:
+            # Positional notation: YAML 1.1 reads '3e-05' as a string
+            line = f'{key}: {np.format_float_positional(value, trim="-")}'
+        pattern = re.compile(rf'^{re.escape(key)}:[^#\n]*?(?=[ \t]*(#|$))', re.MULTILINE)
+        if pattern.search(text):
+            text = pattern.sub(line.replace('\\', '\\\\'), text, count=1)
+        else:
+            text = text.rstrip('\n') + f'\n{line}\n'
+    with open(config_file, 'w') as f:
+        f.write(text)
+
+
+def print_table(results, best):
+    print(f"{'nplc':>6}  {'autozero':>8}  {'resolution':>10}  {'rate_hz':>9}  {'noise_v':>9}  sustained")
+    for result in results:
+        marker = '  <-- chosen' if result is best else ''
+        print(f"{result['nplc']:>6}  {result['autozero']:>8}  {result['resolution']:>10.2g}  {result['rate']:>9.2f}  "
+              f"{result['noise']:>9.3g}  {str(result['sustained']):>9}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune NPLC, resolution and autozero for the target sample rate.")
+    parser.add_argument('--config', type=str, default='config.yaml', help="Path to the configuration file.")
+    parser.add_argument('--output', type=str, help="Write the chosen profile here instead of back to --config.")
+    parser.add_argument('--duration', type=float, default=2.0, help="Seconds of acquisition per candidate.")
+    args = parser.parse_args()
+
+    config = AgilentDMM.load_config(args.config)
+    measurement_frequency = config.get('measurement_frequency', 10)
+    dmm = AgilentDMM(config)
+    try:
+        dmm.setup_instrument()
+        best, results = tune(dmm, measurement_frequency, args.duration,
+                             line_frequency=config.get('line_frequency', 60.0))
+    finally:
+        dmm.close()
+
+    if best is None:
+        print(f"No NPLC setting fits a {measurement_frequency} Hz sample period.")
+        return
+    print_table(results, best)
+    output = args.output or args.config
+    if args.output:
+        with open(args.config, 'r') as src, open(output, 'w') as dst:
+            dst.write(src.read())
+    write_profile(output, {'nplc': best['nplc'], 'resolution': best['resolution'], 'autozero': best['autozero']})
+    print(f"Wrote NPLC {best['nplc']}, resolution {best['resolution']:.2g}, autozero {best['autozero']} to {output}")
+
+
+if __name__ == "__main__":
+    main()
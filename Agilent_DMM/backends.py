@@ -0,0 +1,369 @@
+"""
+Acquisition backends.
+
+Every source of voltage readings implements the Backend interface, so the
+acquisition loops (AgilentDMM.acquire, engine.AcquisitionEngine) don't care
+which driver is underneath:
+
+    setup_instrument()                       connect and configure
+    start_acquisition(frequency, test_time)  arm; returns the DeadlineScheduler
+                                             that paces read_block()
+    read_block(n)                            up to n readings as
+                                             (monotonic times, voltages) arrays
+    stop_acquisition()                       stop; returns readings still held
+    close()
+    finished                                 True once a finite source (a
+                                             replayed recording) has run out
+
+Backends read whole blocks wherever the driver can: 34461A reading memory
+drained with R? (AgilentDMM in burst mode, over qcodes or raw pyvisa), IVI
+multi-point reads (Kt34400Backend) and sample-clocked DAQmx reads
+(NidaqBackend). Single-sample polling is the fallback. ReplayBackend plays
+a recorded session back instead of reading an instrument.
+"""
+
+import time
+import queue
+import logging
+import numpy as np
+from scheduler import DeadlineScheduler
+
+
+class Backend:
+    """Base class for acquisition backends."""
+
+    identity = {}
+    finished = False
+
+    def setup_instrument(self):
+        raise NotImplementedError
+
+    def start_acquisition(self, measurement_frequency, test_time):
+        raise NotImplementedError
+
+    def read_block(self, n=None):
+        raise NotImplementedError
+
+    def stop_acquisition(self):
+        return np.empty(0), np.empty(0)
+
+    def close(self):
+        raise NotImplementedError
+
+
+class PyvisaKeysight34461A:
+    """
+    Raw pyvisa connection exposing the same calls AgilentDMM makes on the qcodes
+    driver (write/ask/visa_handle/IDN/volt/close), without the qcodes connect
+    handshake.
+    """
+
+    def __init__(self, name, address, timeout=5.0):
+        import pyvisa
+
+        self.name = name
+        self.visa_handle = pyvisa.ResourceManager().open_resource(address)
+        self.visa_handle.timeout = timeout * 1000
+        self.visa_handle.read_termination = '\n'
+        self.visa_handle.write_termination = '\n'
+
+    def write(self, command):
+        self.visa_handle.write(command)
+
+    def ask(self, command):
+        return self.visa_handle.query(command)
+
+    def IDN(self):
+        vendor, model, serial, firmware = (part.strip() for part in self.ask('*IDN?').split(',', 3))
+        return {'vendor': vendor, 'model': model, 'serial': serial, 'firmware': firmware}
+
+    def volt(self):
+        return float(self.ask('READ?'))
+
+    def close(self):
+        self.visa_handle.close()
+
+
+class Kt34400Backend(Backend):
+    """
+    Keysight IVI driver (keysight_kt34400), as used by dmm.py.
+
+    Block reads use the instrument's sample timer, so each reading of a
+    block is `sample_interval` after the previous one and its time follows
+    from the interval read back from the driver, as in the 34461A burst
+    path. A block holds `burst_poll_interval` seconds of readings (at most
+    `burst_block_size`), so every read returns about as often as an R?
+    drain does. A driver without multi-point reads or a timer sample
+    trigger is polled one reading at a time instead.
+    """
+
+    def __init__(self, config):
+        self.resource_name = config['visa_addr']
+        self.options = config.get('ivi_options', "QueryInstrStatus=False, Simulate=False, Trace=False")
+        self.range = config.get('range', 10)
+        self.resolution = config.get('resolution', 0.0001)
+        self.max_block_size = config.get('burst_block_size', 1000)
+        self.poll_interval = config.get('burst_poll_interval', 0.1)  # Seconds of readings per block read
+        self.overrun_policy = config.get('overrun_policy', 'skip')
+        self.driver = None
+        self.block_read = False
+
+    def setup_instrument(self):
+        import keysight_kt34400 as kt
+
+        self.driver = kt.Kt34400(self.resource_name, True, True, self.options)
+        self.driver.trigger.source = kt.TriggerSource.IMMEDIATE
+        self.driver.dc_voltage.configure(self.range, self.resolution)
+        self.identity = {
+            'vendor': self.driver.identity.vendor,
+            'model': self.driver.identity.instrument_model,
+            'revision': self.driver.identity.revision,
+        }
+        # Multi-point reads and the timer sample trigger are only available in newer driver releases
+        multi_point = self.driver.trigger.multi_point
+        self.block_read = (hasattr(self.driver.measurement, 'read_multiple_point')
+                           and hasattr(multi_point, 'sample_interval') and hasattr(kt, 'SampleTrigger'))
+        self.timer_trigger = kt.SampleTrigger.TIMER if self.block_read else None
+        logging.info(f"Kt34400 driver initialized (block reads: {self.block_read}).")
+
+    def start_acquisition(self, measurement_frequency, test_time):
+        self.frequency = measurement_frequency
+        if self.block_read:
+            # The instrument paces the samples on its timer; we only pace the driver calls
+            # Short blocks, so a read never blocks stop() or live consumers for long
+            self.block_size = max(1, min(self.max_block_size, round(self.poll_interval * measurement_frequency)))
+            multi_point = self.driver.trigger.multi_point
+            multi_point.sample_trigger = self.timer_trigger
+            multi_point.sample_interval = 1 / measurement_frequency
+            multi_point.sample_count = self.block_size
+            # The instrument coerces the timer to its own resolution, so use its value for timestamps
+            self.sample_interval = float(multi_point.sample_interval)
+            logging.info(f"Kt34400 blocks of {self.block_size} samples every {self.sample_interval} s.")
+            return DeadlineScheduler(1 / (self.sample_interval * self.block_size), 'catch_up')
+        return DeadlineScheduler(measurement_frequency, self.overrun_policy)
+
+    def read_block(self, n=None):
+        if not self.block_read:
+            volts = self.driver.measurement.read()
+            return (time.monotonic(),), (volts,)
+        timeout_ms = int(1000 * (2 * self.block_size * self.sample_interval + 1))
+        started = time.monotonic()
+        readings = np.asarray(self.driver.measurement.read_multiple_point(timeout_ms))
+        # The first sample is taken as the read triggers; the rest follow on the sample timer
+        return started + np.arange(len(readings)) * self.sample_interval, readings
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.close()
+            self.driver = None
+            logging.info("Kt34400 driver closed.")
+
+
+class NidaqBackend(Backend):
+    """
+    NI-DAQmx analog input channel running on the DAQ sample clock.
+
+    The task acquires continuously at measurement_frequency into the DAQmx
+    buffer. Sample times are reconstructed from the clock rate rather than
+    stamped per read. Two ways of getting the data out:
+
+    - polled (default): read_block() drains whatever has accumulated.
+    - streaming (`nidaq_streaming: true`): DAQmx calls back every
+      `stream_block_size` samples and a numpy stream reader copies them
+      straight into one of `stream_buffers` preallocated arrays, which are
+      queued for read_block() and handed back once copied. While every
+      buffer is taken the samples stay in the DAQmx buffer and are read,
+      with their own sample indices, on a later callback. Nothing runs per
+      sample in Python.
+    """
+
+    def __init__(self, config):
+        self.channel = config['channel']
+        self.min_val = config.get('min_val', -10.0)
+        self.max_val = config.get('max_val', 10.0)
+        self.block_size = config.get('burst_block_size', 1000)
+        self.poll_interval = config.get('burst_poll_interval', 0.1)  # Seconds between buffer drains
+        self.streaming = config.get('nidaq_streaming', False)
+        self.stream_block_size = config.get('stream_block_size', 100)  # Samples per DAQmx callback
+        self.stream_buffers = config.get('stream_buffers', 16)  # Preallocated callback buffers
+        self.task = None
+        self.sample_index = 0
+        self.overflows = 0
+
+    def setup_instrument(self):
+        import nidaqmx
+
+        self.task = nidaqmx.Task()
+        self.task.ai_channels.add_ai_voltage_chan(self.channel, min_val=self.min_val, max_val=self.max_val)
+        self.identity = {'channel': self.channel}
+        logging.info(f"NI-DAQmx channel {self.channel} set up.")
+
+    def start_acquisition(self, measurement_frequency, test_time):
+        from nidaqmx.constants import AcquisitionType
+
+        self.rate = measurement_frequency
+        buffer_size = max(int(measurement_frequency * self.poll_interval * 10), self.block_size)
+        if self.streaming:
+            # Room for the samples that wait in the DAQmx buffer while every stream buffer is taken
+            buffer_size = max(buffer_size, 2 * self.stream_buffers * self.stream_block_size)
+        self.task.timing.cfg_samp_clk_timing(rate=measurement_frequency, sample_mode=AcquisitionType.CONTINUOUS,
+                                             samps_per_chan=buffer_size)
+        self.sample_index = 0
+        if self.streaming:
+            self._start_streaming()
+        self.task.start()
+        self.start_time = time.monotonic()
+        return DeadlineScheduler(1 / self.poll_interval, 'skip')
+
+    def _start_streaming(self):
+        from nidaqmx.stream_readers import AnalogSingleChannelReader
+
+        self.reader = AnalogSingleChannelReader(self.task.in_stream)
+        pool = np.zeros((self.stream_buffers, self.stream_block_size))
+        # A buffer is either free, or filled and waiting for read_block(); never both
+        self.free = queue.Queue()
+        for buffer in pool:
+            self.free.put_nowait(buffer)
+        self.filled = queue.Queue()
+        self.task.register_every_n_samples_acquired_into_buffer_event(self.stream_block_size, self._on_samples)
+
+    def _on_samples(self, task_handle, event_type, number_of_samples, callback_data):
+        """DAQmx callback: copy finished blocks into free buffers without blocking the driver thread."""
+        while self.task.in_stream.avail_samp_per_chan >= self.stream_block_size:
+            try:
+                buffer = self.free.get_nowait()
+            except queue.Empty:
+                # Consumer holds every buffer; leave the samples in the DAQmx buffer for the next callback
+                self.overflows += 1
+                break
+            self.reader.read_many_sample(buffer, number_of_samples_per_channel=self.stream_block_size, timeout=0)
+            self.filled.put_nowait((self.sample_index, buffer))
+            self.sample_index += self.stream_block_size
+        return 0
+
+    def _read_streamed(self, n):
+        times, readings = [], []
+        count = 0
+        while count < n:
+            try:
+                index, buffer = self.filled.get_nowait()
+            except queue.Empty:
+                break
+            times.append(self.start_time + (index + np.arange(len(buffer))) / self.rate)
+            readings.append(buffer.copy())
+            self.free.put_nowait(buffer)
+            count += len(buffer)
+        if not readings:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(times), np.concatenate(readings)
+
+    def read_block(self, n=None):
+        if self.streaming:
+            return self._read_streamed(n or self.block_size)
+        available = self.task.in_stream.avail_samp_per_chan
+        count = min(available, n or self.block_size)
+        if count == 0:
+            return np.empty(0), np.empty(0)
+        readings = np.asarray(self.task.read(number_of_samples_per_channel=count), dtype=np.float64)
+        times = self.start_time + (self.sample_index + np.arange(len(readings))) / self.rate
+        self.sample_index += len(readings)
+        return times, readings
+
+    def stop_acquisition(self):
+        if self.streaming:
+            self.task.stop()
+            if self.overflows:
+                logging.warning(f"NI-DAQmx {self.channel}: {self.overflows} callbacks found no free stream buffer.")
+            return self._read_streamed(self.stream_buffers * self.stream_block_size)
+        times, readings = self.read_block(self.task.in_stream.avail_samp_per_chan)
+        self.task.stop()
+        return times, readings
+
+    def close(self):
+        if self.task is not None:
+            self.task.close()
+            self.task = None
+            logging.info(f"NI-DAQmx channel {self.channel} closed.")
+
+
+class ReplayBackend(Backend):
+    """
+    Plays a recorded session (PDMS_Test_*.csv, HDF5, compact file or segmented
+    session directory) back through the acquisition path.
+
+    The recording is streamed in chunks, so its length doesn't matter. Samples
+    keep their recorded spacing, shifted to start when acquisition starts, and
+    are released once they are due at `replay_speed` times real time: 1 is
+    real time, 100 plays an hour in 36 s and 0 releases them as fast as the
+    pipeline takes them. `finished` is set when the recording runs out.
+    """
+
+    def __init__(self, config):
+        self.filename = config['replay_file']
+        self.speed = config.get('replay_speed', 1.0)
+        self.block_size = config.get('burst_block_size', 1000)
+        self.poll_interval = config.get('burst_poll_interval', 0.1)  # Seconds between reads when paced
+        self.chunks = None
+        self.times = self.voltages = np.empty(0)
+        self.position = 0
+        self.origin = None
+        self.start_time = None
+        self.finished = False
+
+    def setup_instrument(self):
+        import os
+
+        if not os.path.exists(self.filename):
+            raise FileNotFoundError(f"Replay file {self.filename} not found")
+        self.identity = {'model': 'replay', 'serial': os.path.basename(os.path.normpath(self.filename)),
+                         'source': self.filename}
+        logging.info(f"Replaying {self.filename} at {f'{self.speed:g}x' if self.speed else 'maximum'} speed.")
+
+    def start_acquisition(self, measurement_frequency, test_time):
+        from analysis import iter_chunks
+
+        self.chunks = iter_chunks(self.filename)
+        self.finished = not self._next_chunk()
+        if not self.finished:
+            self.origin = float(self.times[0])
+        self.start_time = time.monotonic()
+        # Unpaced replay only yields between blocks
+        return DeadlineScheduler(1 / self.poll_interval if self.speed else 1e6, 'skip')
+
+    def _next_chunk(self):
+        """Load the next non-empty chunk; False once the recording is exhausted."""
+        for times, voltages in self.chunks:
+            if len(times):
+                self.times, self.voltages, self.position = np.asarray(times), np.asarray(voltages), 0
+                return True
+        return False
+
+    def read_block(self, n=None):
+        limit = n or self.block_size
+        if self.speed:
+            due = self.origin + (time.monotonic() - self.start_time) * self.speed
+        else:
+            due = np.inf
+        times, readings = [], []
+        count = 0
+        while count < limit and not self.finished:
+            if self.position == len(self.times):
+                self.finished = not self._next_chunk()
+                continue
+            end = min(len(self.times), self.position + limit - count)
+            end = self.position + int(np.searchsorted(self.times[self.position:end], due, side='right'))
+            if end == self.position:
+                break
+            times.append(self.times[self.position:end])
+            readings.append(self.voltages[self.position:end])
+            count += end - self.position
+            self.position = end
+        if not readings:
+            return np.empty(0), np.empty(0)
+        return self.start_time + (np.concatenate(times) - self.origin), np.concatenate(readings)
+
+    def close(self):
+        if self.chunks is not None:
+            self.chunks.close()
+            self.chunks = None
+            logging.info(f"Replay of {self.filename} closed.")
@@ -0,0 +1,171 @@
+"""
+Acquisition benchmarks against the simulated 34461A.
+
+Runs the real AgilentDMM acquisition path (without the live plot) for every
+combination of acquisition mode and output format and reports throughput,
+time to first sample, delivery latency, scheduling jitter, memory and disk
+growth per hour of recording and CPU usage. No instrument or VISA installation is needed.
+
+Memory is measured in a separate pass of --memory-duration seconds, since
+tracemalloc would slow down the timed pass. Growth is the least-squares
+slope of the traced memory after a warm-up, so one-off allocations such as
+the first sample buffer chunk don't count as a per-hour cost.
+
+With --replay the cases are fed from a recorded session instead, so the
+pipeline is measured against real signal shapes; --speed 0 (the default
+there) replays as fast as the pipeline goes and `achieved_hz` becomes its
+throughput. Each replay case stops when the recording runs out or after
+--duration seconds.
+
+Usage:
+    python benchmark.py --frequency 100 --duration 10 --json results.json
+    python benchmark.py --replay ../PDMS_Tests/PDMS_Test_2024-06-26_20-43-27.csv --duration 60
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import numpy as np
+from agilent_dmm import AgilentDMM
+
+MODES = ('poll', 'burst')
+FORMATS = ('csv', 'hdf5', 'compact')
+
+
+def case_config(mode, output_format, latency, output_dir, replay=None, speed=0.0):
+    config = {
+        'visa_addr': 'SIM::INSTR',
+        'simulate': True,
+        'sim_latency': latency,
+        'acquisition_mode': mode,
+        'output_format': output_format,
+        'output_dir': output_dir,
+        'log_file': os.path.join(output_dir, 'benchmark.log'),
+        'profile_cache': os.path.join(output_dir, 'profile_cache.json'),
+    }
+    if replay:
+        config.update({'source': 'replay', 'replay_file': replay, 'replay_speed': speed})
+    return config
+
+
+def run_case(mode, output_format, frequency, duration, latency, output_dir, replay=None, speed=0.0):
+    """Run one acquisition session and return its timing, CPU and disk measurements."""
+    dmm = AgilentDMM(case_config(mode, output_format, latency, output_dir, replay, speed))
+    dmm.setup_instrument()
+
+    # Delivery latency: age of the newest sample when it reaches record()
+    latencies = []
+    record = dmm.record
+
+    def timed_record(timestamps, readings):
+        # Replayed samples carry their recorded timeline, so their age means nothing
+        if len(readings) and not replay:
+            latencies.append(time.monotonic() - timestamps[-1])
+        record(timestamps, readings)
+
+    dmm.record = timed_record
+
+    cpu_before = time.process_time()
+    start_time = dmm.start_session(frequency)
+    acquisition = threading.Thread(target=dmm.acquire, args=(frequency, duration, start_time))
+    acquisition.start()
+    acquisition.join()
+    elapsed = time.monotonic() - start_time
+    cpu = time.process_time() - cpu_before
+    dmm.save_data()
+    dmm.close()
+
+    times, _ = dmm.samples.view()
+    intervals = np.diff(times) * 1e3
+    report = dmm.scheduler.report()
+    disk = os.path.getsize(dmm.output_filename)
+    latencies = np.array(latencies) * 1e3
+    # Per hour of recorded signal, which for a replay is not the time it took
+    recorded = times[-1] - times[0] if replay and len(times) > 1 else elapsed
+    return {
+        'mode': 'replay' if replay else mode,
+        'format': output_format,
+        'target_hz': frequency,
+        'achieved_hz': len(dmm.samples) / elapsed,
+        'samples': len(dmm.samples),
+        'first_sample_ms': (dmm.first_sample_delay or 0.0) * 1e3,
+        'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        'interval_std_ms': float(intervals.std()) if len(intervals) else 0.0,
+        'lateness_p99_ms': report['lateness_p99_ms'],
+        'disk_mb_per_hour': disk / recorded * 3600 / 1e6,
+        'cpu_percent': cpu / elapsed * 100,
+    }
+
+
+def measure_memory(mode, output_format, frequency, duration, latency, output_dir, replay=None, speed=0.0,
+                   interval=0.5):
+    """Traced memory growth in MB per hour over the steady state, and the peak in MB, of a separate run."""
+    dmm = AgilentDMM(case_config(mode, output_format, latency, output_dir, replay, speed))
+    dmm.setup_instrument()
+    tracemalloc.start()
+    start_time = dmm.start_session(frequency)
+    acquisition = threading.Thread(target=dmm.acquire, args=(frequency, duration, start_time))
+    acquisition.start()
+    acquisition.join(duration * 0.2)  # Warm-up; a fast replay may be over sooner
+    points = []
+    while acquisition.is_alive():
+        points.append((time.monotonic(), tracemalloc.get_traced_memory()[0]))
+        acquisition.join(interval)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    dmm.save_data()
+    dmm.close()
+    if len(points) < 2:
+        return {'memory_mb_per_hour': float('nan'), 'peak_memory_mb': peak / 1e6}
+    times, memory = np.array(points).T
+    return {'memory_mb_per_hour': float(np.polyfit(times - times[0], memory, 1)[0]) * 3600 / 1e6,
+            'peak_memory_mb': peak / 1e6}
+
+
+def print_table(results):
+    columns = list(results[0].keys())
+    widths = [max(len(c), 9) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        cells = [f'{v:.2f}' if isinstance(v, float) else str(v) for v in result.values()]
+        print('  '.join(c.rjust(w) for c, w in zip(cells, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AgilentDMM acquisition modes and writers.")
+    parser.add_argument('--frequency', type=float, default=100, help="Target sample rate in Hz.")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per case.")
+    parser.add_argument('--memory-duration', type=float, default=30,
+                        help="Seconds of the separate memory pass per case; 0 skips it.")
+    parser.add_argument('--latency', type=float, default=0.002, help="Simulated VISA round trip in seconds.")
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--replay', type=str, help="Replay this recorded session instead of the simulator.")
+    parser.add_argument('--speed', type=float, default=0.0, help="Replay speed; 0 is as fast as possible.")
+    parser.add_argument('--json', type=str, help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for mode in (['replay'] if args.replay else args.modes):
+            for output_format in args.formats:
+                result = run_case(mode, output_format, args.frequency, args.duration,
+                                  args.latency, output_dir, args.replay, args.speed)
+                if args.memory_duration:
+                    result.update(measure_memory(mode, output_format, args.frequency, args.memory_duration,
+                                                 args.latency, output_dir, args.replay, args.speed))
+                results.append(result)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
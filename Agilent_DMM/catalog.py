@@ -0,0 +1,343 @@
+"""
+Catalog of recorded sessions for wall-clock time-range queries.
+
+`scan` indexes every session it finds under the given directories into a
+small SQLite database: PDMS_Test_*.csv files, HDF5 and compact session
+files, and segmented session directories. Each session gets its start/end time, sample
+count, settings and instrument serial (from the '.meta.json' sidecar for
+CSV files), and is split into chunks with their own time span, min/max and
+location (byte range for CSV, row range for HDF5, byte range of whole stored
+chunks for compact files). Unchanged files are skipped on later scans, and
+sessions that no longer exist are dropped.
+
+`query` returns the samples for any wall-clock range across all sessions,
+reading only the chunks that overlap it. Chunks whose file has since been
+deleted (e.g. by retention) are skipped.
+
+Usage:
+    python catalog.py scan ../PDMS_Tests .
+    python catalog.py list
+    python catalog.py query "2024-06-26 20:50" "2024-06-26 20:52" --csv window.csv
+"""
+
+import io
+import os
+import json
+import sqlite3
+import logging
+import argparse
+from datetime import datetime
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    kind TEXT,
+    start_time REAL,
+    end_time REAL,
+    samples INTEGER,
+    serial TEXT,
+    config TEXT,
+    signature TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    session_id INTEGER REFERENCES sessions(id) ON DELETE CASCADE,
+    file TEXT,
+    start_time REAL,
+    end_time REAL,
+    first INTEGER,
+    last INTEGER,
+    rows INTEGER,
+    min REAL,
+    max REAL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_time ON chunks (start_time, end_time);
+"""
+
+
+def to_epoch(value):
+    """Epoch seconds from a number, a datetime or a local 'YYYY-mm-dd HH:MM[:SS]' string."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _csv_chunks(path, chunk_bytes):
+    """(first byte, last byte, rows, times, voltages) for runs of whole lines of about chunk_bytes."""
+    import pandas as pd
+    from session_file import parse_timestamps
+
+    with open(path, 'rb') as f:
+        offset = len(f.readline())  # Header
+        carry = b''
+        while True:
+            block = f.read(chunk_bytes)
+            data = carry + block
+            end = data.rfind(b'\n') + 1 if block else len(data)
+            carry = data[end:]
+            if end:
+                frame = pd.read_csv(io.BytesIO(data[:end]), header=None, names=['timestamp', 'voltage'],
+                                    dtype={'timestamp': str, 'voltage': float})
+                yield (offset, offset + end, len(frame), parse_timestamps(frame['timestamp'].to_numpy()),
+                       frame['voltage'].to_numpy())
+                offset += end
+            if not block:
+                return
+
+
+def _hdf5_chunks(path, chunk_rows):
+    """(first row, last row, rows, times, voltages) for fixed runs of chunk_rows rows."""
+    import h5py
+
+    with h5py.File(path, 'r') as f:
+        total = min(f['time'].shape[0], f['voltage'].shape[0])
+        for first in range(0, total, chunk_rows):
+            last = min(first + chunk_rows, total)
+            yield first, last, last - first, f['time'][first:last], f['voltage'][first:last]
+
+
+def _compact_chunks(path, chunk_rows):
+    """(first byte, last byte, rows, times, voltages) for runs of stored chunks of about chunk_rows rows."""
+    from compact_file import iter_compact_chunks
+
+    run = []
+    rows = 0
+    for chunk in iter_compact_chunks(path):
+        run.append(chunk)
+        rows += len(chunk[2])
+        if rows >= chunk_rows:
+            yield _merge_run(run)
+            run = []
+            rows = 0
+    if run:
+        yield _merge_run(run)
+
+
+def _merge_run(run):
+    times = np.concatenate([chunk[2] for chunk in run])
+    return run[0][0], run[-1][1], len(times), times, np.concatenate([chunk[3] for chunk in run])
+
+
+FILE_KINDS = {'.csv': 'csv', '.h5': 'hdf5', '.dmmz': 'compact'}
+
+
+def _file_kind(name):
+    return FILE_KINDS.get(os.path.splitext(name)[1])
+
+
+class Catalog:
+    def __init__(self, db_path='catalog.sqlite', chunk_bytes=1 << 20, chunk_rows=65536):
+        self.db_path = db_path
+        self.chunk_bytes = chunk_bytes
+        self.chunk_rows = chunk_rows
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def scan(self, *directories):
+        """Index new or changed sessions under the directories; returns how many were (re)indexed."""
+        indexed = 0
+        for directory in directories:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.abspath(os.path.join(directory, name))
+                if not name.startswith('PDMS_Test_'):
+                    continue
+                if os.path.isdir(path) and os.path.isfile(os.path.join(path, 'manifest.json')):
+                    kind = 'segmented'
+                elif _file_kind(name) and not name.endswith('.events.csv'):
+                    kind = _file_kind(name)
+                else:
+                    continue
+                try:
+                    indexed += self._index(path, kind)
+                except Exception as e:
+                    logging.error(f"Could not index {path}: {e}")
+        with self.db:
+            gone = [(path,) for path, in self.db.execute('SELECT path FROM sessions') if not os.path.exists(path)]
+            self.db.executemany('DELETE FROM sessions WHERE path = ?', gone)
+        return indexed
+
+    @staticmethod
+    def _signature(path, kind):
+        target = os.path.join(path, 'manifest.json') if kind == 'segmented' else path
+        stat = os.stat(target)
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def _index(self, path, kind):
+        signature = self._signature(path, kind)
+        row = self.db.execute('SELECT signature FROM sessions WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == signature:
+            return 0
+
+        metadata = {}
+        if kind == 'csv':
+            sidecar = os.path.splitext(path)[0] + '.meta.json'
+            if os.path.isfile(sidecar):
+                with open(sidecar) as f:
+                    metadata = json.load(f)
+            files = [(path, 'csv')]
+        elif kind == 'hdf5':
+            from session_file import read_metadata
+
+            metadata = {key: (value.item() if hasattr(value, 'item') else value)
+                        for key, value in read_metadata(path).items()}
+            files = [(path, 'hdf5')]
+        elif kind == 'compact':
+            from compact_file import scan_chunks
+
+            metadata = scan_chunks(path)[0]
+            files = [(path, 'compact')]
+        else:
+            from segments import read_manifest
+
+            manifest = read_manifest(path)
+            metadata = manifest.get('metadata', {})
+            files = [(os.path.join(path, segment['file']), _file_kind(segment['file']))
+                     for segment in manifest['segments']]
+
+        with self.db:
+            self.db.execute('DELETE FROM sessions WHERE path = ?', (path,))
+            session_id = self.db.execute(
+                'INSERT INTO sessions (path, kind, serial, config, signature) VALUES (?, ?, ?, ?, ?)',
+                (path, kind, str(metadata.get('instrument_serial', '')), json.dumps(metadata, default=str),
+                 signature)).lastrowid
+            for filename, file_kind in files:
+                if not os.path.exists(filename):
+                    continue
+                if file_kind == 'csv':
+                    chunks = _csv_chunks(filename, self.chunk_bytes)
+                elif file_kind == 'compact':
+                    chunks = _compact_chunks(filename, self.chunk_rows)
+                else:
+                    chunks = _hdf5_chunks(filename, self.chunk_rows)
+                self.db.executemany(
+                    'INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    ((session_id, filename, float(times.min()), float(times.max()), first, last, rows,
+                      float(voltages.min()), float(voltages.max()))
+                     for first, last, rows, times, voltages in chunks if rows))
+            self.db.execute(
+                'UPDATE sessions SET start_time = (SELECT MIN(start_time) FROM chunks WHERE session_id = ?), '
+                'end_time = (SELECT MAX(end_time) FROM chunks WHERE session_id = ?), '
+                'samples = (SELECT COALESCE(SUM(rows), 0) FROM chunks WHERE session_id = ?) WHERE id = ?',
+                (session_id, session_id, session_id, session_id))
+        logging.info(f"Indexed {path}")
+        return 1
+
+    def sessions(self, start=None, stop=None):
+        """Session rows overlapping [start, stop] as dicts, oldest first."""
+        start = -np.inf if start is None else to_epoch(start)
+        stop = np.inf if stop is None else to_epoch(stop)
+        cursor = self.db.execute(
+            'SELECT id, path, kind, start_time, end_time, samples, serial, config FROM sessions '
+            'WHERE end_time >= ? AND start_time <= ? ORDER BY start_time', (start, stop))
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def chunks(self, start, stop):
+        """(session id, file, first, last) of every chunk overlapping [start, stop], in time order."""
+        return self.db.execute(
+            'SELECT session_id, file, first, last FROM chunks WHERE end_time >= ? AND start_time <= ? '
+            'ORDER BY start_time', (to_epoch(start), to_epoch(stop))).fetchall()
+
+    def query(self, start, stop):
+        """
+        (epoch times, voltages, session ids) for [start, stop] across every
+        session, sorted by time. Only the chunks overlapping the range are read.
+        """
+        start, stop = to_epoch(start), to_epoch(stop)
+        parts = []
+        missing = set()
+        for session_id, filename, first, last in self.chunks(start, stop):
+            if filename in missing or not os.path.exists(filename):
+                # Deleted by retention since the last scan; rescanning drops it from the index
+                if filename not in missing:
+                    logging.warning(f"Skipping {filename}, no longer on disk.")
+                    missing.add(filename)
+                continue
+            if filename.endswith('.csv'):
+                times, voltages = self._read_csv_chunk(filename, first, last)
+            elif filename.endswith('.dmmz'):
+                times, voltages = self._read_compact_chunk(filename, first, last)
+            else:
+                times, voltages = self._read_hdf5_chunk(filename, first, last)
+            mask = (times >= start) & (times <= stop)
+            parts.append((times[mask], voltages[mask], np.full(mask.sum(), session_id)))
+        if not parts:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=int)
+        times, voltages, sessions = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(times, kind='stable')
+        return times[order], voltages[order], sessions[order]
+
+    @staticmethod
+    def _read_csv_chunk(filename, first, last):
+        import pandas as pd
+        from session_file import parse_timestamps
+
+        with open(filename, 'rb') as f:
+            f.seek(first)
+            data = f.read(last - first)
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=['timestamp', 'voltage'],
+                            dtype={'timestamp': str, 'voltage': float})
+        return parse_timestamps(frame['timestamp'].to_numpy()), frame['voltage'].to_numpy()
+
+    @staticmethod
+    def _read_compact_chunk(filename, first, last):
+        from compact_file import iter_compact_chunks
+
+        chunks = list(iter_compact_chunks(filename, first, last))
+        return np.concatenate([chunk[2] for chunk in chunks]), np.concatenate([chunk[3] for chunk in chunks])
+
+    @staticmethod
+    def _read_hdf5_chunk(filename, first, last):
+        import h5py
+
+        with h5py.File(filename, 'r') as f:
+            return f['time'][first:last], f['voltage'][first:last]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index recorded sessions and query them by wall-clock time.")
+    parser.add_argument('--db', type=str, default='catalog.sqlite', help="Catalog database file.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    scan = subparsers.add_parser('scan', help="Index new or changed sessions.")
+    scan.add_argument('directories', nargs='+')
+    listing = subparsers.add_parser('list', help="List indexed sessions.")
+    listing.add_argument('--start', type=str)
+    listing.add_argument('--stop', type=str)
+    query = subparsers.add_parser('query', help="Samples between two local times.")
+    query.add_argument('start', type=str)
+    query.add_argument('stop', type=str)
+    query.add_argument('--csv', type=str, help="Write the samples here instead of printing a summary.")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.db)
+    try:
+        if args.command == 'scan':
+            print(f"Indexed {catalog.scan(*args.directories)} sessions.")
+        elif args.command == 'list':
+            for session in catalog.sessions(args.start, args.stop):
+                print(f"{datetime.fromtimestamp(session['start_time'])}  {datetime.fromtimestamp(session['end_time'])}  "
+                      f"{session['samples']:>10}  {session['serial'] or '-':>12}  {session['path']}")
+        else:
+            times, voltages, sessions = catalog.query(args.start, args.stop)
+            if args.csv:
+                from sample_buffer import SampleBuffer
+
+                timestamps = SampleBuffer(anchor=(0.0, 0.0)).format_timestamps(times)
+                with open(args.csv, 'w', newline='') as f:
+                    f.write('timestamp,voltage\n')
+                    f.writelines(f'{t},{v!r}\n' for t, v in zip(timestamps, voltages.tolist()))
+            print(f"{len(times)} samples from {len(np.unique(sessions))} sessions"
+                  + (f", {voltages.min():.7g} to {voltages.max():.7g} V" if len(voltages) else ""))
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Compact session files (.dmmz) for long AgilentDMM recordings.
+
+Voltages are quantized to `quantum` volts (the DMM's configured resolution
+by default) and times to microseconds, then each chunk stores
+    - time steps minus the nominal sample period (mostly tiny jitter)
+    - differences between consecutive voltage codes
+as the narrowest integer type that holds them, byte-shuffled (all low
+bytes, then the next bytes, ...) and compressed with zlib (or zstd when the
+zstandard package is installed and asked for).
+
+Layout, little-endian:
+    b'DMMZ', uint16 version, uint32 n, then n bytes of JSON metadata
+    (including quantum, period_us and codec)
+    per chunk:
+        b'DMMC', uint8 codec, uint8 time width, uint8 voltage width,
+        uint32 rows, uint32 exceptions, uint32 payload bytes,
+        int64 first time (epoch microseconds), int64 first voltage code,
+        then the compressed payload: shuffled time steps, shuffled
+        voltage steps, exception row numbers (uint32) and their float64 values
+
+Readings that cannot be quantized (NaN, overload) are kept as exceptions.
+Every chunk is self-contained; a chunk cut short by a crash is ignored on
+reading and trimmed by `repair`. The file only ever receives full chunks
+of `chunk_rows` rows, so chunks compress well however often the recorder
+flushes. Until a chunk is full, each flush appends the rows added since the
+last one as a small chunk to a journal beside the file (`<file>.journal`,
+same chunk layout, no file header). Once the full chunk is fsync'd to the
+file the journal is emptied, and on close it is deleted. Nothing that was
+fsync'd is ever overwritten; `repair` folds a crashed writer's journal back
+into the file.
+
+Usage:
+    python compact_file.py convert PDMS_Test_2024-06-26_20-43-27.csv --quantum 0.0001 --frequency 6
+    python compact_file.py info PDMS_Test_2024-06-26_20-43-27.dmmz
+"""
+
+import os
+import json
+import zlib
+import struct
+import logging
+import argparse
+import numpy as np
+
+MAGIC = b'DMMZ'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sHI')
+CHUNK_MAGIC = b'DMMC'
+CHUNK_HEADER = struct.Struct('<4sBBBIIIqq')
+CODECS = {'zlib': 0, 'zstd': 1}
+WIDTHS = [np.dtype('<i1'), np.dtype('<i2'), np.dtype('<i4'), np.dtype('<i8')]
+MAX_CODE = 2 ** 62  # Larger codes would overflow the deltas
+JOURNAL = '.journal'
+
+
+def _compress(codec, data):
+    if codec == CODECS['zstd']:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec, data):
+    if codec == CODECS['zstd']:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _narrowest(values):
+    """Index into WIDTHS of the smallest integer type that holds every value."""
+    if not len(values):
+        return 0
+    low, high = int(values.min()), int(values.max())
+    for width, dtype in enumerate(WIDTHS):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return width
+    return len(WIDTHS) - 1
+
+
+def _shuffle(values):
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype, count, offset):
+    planes = np.frombuffer(data, np.uint8, count * dtype.itemsize, offset).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(planes.T).view(dtype).ravel()
+
+
+def encode_chunk(times, voltages, quantum, period_us, codec=0):
+    """One chunk of epoch times and voltages as bytes."""
+    times_us = np.round(np.asarray(times) * 1e6).astype(np.int64)
+    scaled = np.asarray(voltages, dtype=np.float64) / quantum
+    exceptions = np.flatnonzero(~(np.abs(scaled) < MAX_CODE))
+    if len(exceptions):
+        scaled = scaled.copy()
+        scaled[exceptions] = np.nan
+        # Carry the previous code over exceptions so the steps around them stay small
+        valid = np.where(np.isnan(scaled), 0, np.arange(len(scaled)))
+        np.maximum.accumulate(valid, out=valid)
+        scaled = np.nan_to_num(scaled[valid])
+    codes = np.round(scaled).astype(np.int64)
+
+    time_steps = np.diff(times_us) - period_us
+    voltage_steps = np.diff(codes)
+    time_width, voltage_width = _narrowest(time_steps), _narrowest(voltage_steps)
+    payload = b''.join((_shuffle(time_steps.astype(WIDTHS[time_width])),
+                        _shuffle(voltage_steps.astype(WIDTHS[voltage_width])),
+                        exceptions.astype('<u4').tobytes(),
+                        np.asarray(voltages, dtype='<f8')[exceptions].tobytes()))
+    payload = _compress(codec, payload)
+    header = CHUNK_HEADER.pack(CHUNK_MAGIC, codec, time_width, voltage_width, len(codes), len(exceptions),
+                               len(payload), int(times_us[0]), int(codes[0]))
+    return header + payload
+
+
+def decode_chunk(header, payload, quantum, period_us):
+    """(epoch times, voltages) of one chunk."""
+    _, codec, time_width, voltage_width, rows, n_exceptions, _, first_us, first_code = header
+    data = _decompress(codec, payload)
+    steps = rows - 1
+    time_bytes = steps * WIDTHS[time_width].itemsize
+    voltage_bytes = steps * WIDTHS[voltage_width].itemsize
+    time_steps = _unshuffle(data, WIDTHS[time_width], steps, 0).astype(np.int64)
+    voltage_steps = _unshuffle(data, WIDTHS[voltage_width], steps, time_bytes).astype(np.int64)
+    times_us = np.empty(rows, dtype=np.int64)
+    times_us[0] = first_us
+    np.cumsum(time_steps + period_us, out=times_us[1:])
+    times_us[1:] += first_us
+    codes = np.empty(rows, dtype=np.int64)
+    codes[0] = first_code
+    np.cumsum(voltage_steps, out=codes[1:])
+    codes[1:] += first_code
+    voltages = codes * quantum
+    if n_exceptions:
+        offset = time_bytes + voltage_bytes
+        rows_out = np.frombuffer(data, '<u4', n_exceptions, offset)
+        voltages[rows_out] = np.frombuffer(data, '<f8', n_exceptions, offset + 4 * n_exceptions)
+    return times_us / 1e6, voltages
+
+
+def default_options(metadata, quantum=None, period=None):
+    """Quantum and nominal period in microseconds from the session metadata, unless given."""
+    if quantum is None:
+        quantum = float(metadata.get('quantum') or metadata.get('resolution') or 1e-6)
+    if period is None:
+        frequency = metadata.get('measurement_frequency')
+        period = 1 / float(frequency) if frequency else 0.0
+    return quantum, int(round(period * 1e6))
+
+
+class CompactWriter:
+    """
+    Writes a .dmmz file in chunks of `chunk_rows` rows. Rows of the chunk
+    being filled go to the journal at each flush, and to the file once the
+    chunk is full.
+    """
+
+    def __init__(self, filename, metadata, quantum=None, period=None, codec=None, chunk_rows=None):
+        self.filename = filename
+        self.quantum, self.period_us = default_options(metadata, quantum, period)
+        codec = codec or metadata.get('codec') or 'zlib'
+        self.codec = CODECS[codec]
+        self.chunk_rows = chunk_rows or metadata.get('chunk_rows') or 4096
+        self.rows = 0
+        self.max_error = 0.0
+        self.open_rows = []  # (times, voltages) blocks of the chunk being filled
+        self.open_count = 0
+        self.journaled = 0  # Rows of the open chunk already in the journal
+        header = dict(metadata, quantum=self.quantum, period_us=self.period_us, codec=codec)
+        encoded = json.dumps(header, default=str).encode()
+        self.file = open(filename, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(encoded)) + encoded)
+        self._sync(self.file)
+        self.journal = open(filename + JOURNAL, 'wb')
+        self.bytes = FILE_HEADER.size + len(encoded)
+
+    def write(self, times, voltages):
+        if not len(times):
+            return
+        self.open_rows.append((times, voltages))
+        self.open_count += len(times)
+        self.rows += len(times)
+        finite = np.abs(voltages) < MAX_CODE * self.quantum
+        if finite.any():
+            error = np.abs(voltages[finite] - np.round(voltages[finite] / self.quantum) * self.quantum).max()
+            self.max_error = max(self.max_error, float(error))
+        if self.open_count >= self.chunk_rows:
+            times, voltages = (np.concatenate(column) for column in zip(*self.open_rows))
+            sealed = len(times) - len(times) % self.chunk_rows
+            for first in range(0, sealed, self.chunk_rows):
+                self._append(times[first:first + self.chunk_rows], voltages[first:first + self.chunk_rows])
+            self._sync(self.file)
+            # Every journaled row is now in a sealed chunk on disk
+            self.journal.seek(0)
+            self.journal.truncate()
+            self.journaled = 0
+            self.open_rows = [(times[sealed:], voltages[sealed:])] if sealed < len(times) else []
+            self.open_count = len(times) - sealed
+
+    def _append(self, times, voltages):
+        chunk = encode_chunk(times, voltages, self.quantum, self.period_us, self.codec)
+        self.file.write(chunk)
+        self.bytes += len(chunk)
+
+    @staticmethod
+    def _sync(f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    @property
+    def ratio(self):
+        """Size of the samples as float64 time and voltage columns over the file size."""
+        return 16 * self.rows / self.bytes
+
+    def flush(self):
+        if self.open_count > self.journaled:
+            times, voltages = (np.concatenate(column) for column in zip(*self.open_rows))
+            self.journal.write(encode_chunk(times[self.journaled:], voltages[self.journaled:], self.quantum,
+                                            self.period_us, self.codec))
+            self.journaled = self.open_count
+        self._sync(self.journal)
+
+    def close(self):
+        if self.open_count:
+            self._append(*(np.concatenate(column) for column in zip(*self.open_rows)))
+            self.open_rows = []
+            self.open_count = 0
+        self._sync(self.file)
+        self.file.close()
+        self.journal.close()
+        os.remove(self.filename + JOURNAL)
+
+
+def read_header(f):
+    """Metadata of an open .dmmz file, leaving it positioned at the first chunk."""
+    magic, version, length = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{f.name} is not a compact session file")
+    if version != VERSION:
+        raise ValueError(f"{f.name} has version {version}, expected {VERSION}")
+    return json.loads(f.read(length))
+
+
+def _walk(f, size):
+    """(offset, header) of each complete chunk from the current position, leaving f at its payload."""
+    offset = f.tell()
+    while offset + CHUNK_HEADER.size <= size:
+        header = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        end = offset + CHUNK_HEADER.size + header[6]
+        if header[0] != CHUNK_MAGIC or end > size:
+            return
+        yield offset, header
+        f.seek(end)
+        offset = end
+
+
+def scan_chunks(filename):
+    """Metadata and (offset, header) of every complete chunk, without decompressing anything."""
+    with open(filename, 'rb') as f:
+        metadata = read_header(f)
+        return metadata, list(_walk(f, os.path.getsize(filename)))
+
+
+def iter_compact_chunks(filename, start=None, stop=None):
+    """
+    (offset, end offset, epoch times, voltages) for each chunk in the byte range
+    [start, stop); a chunk cut short by a crash ends the file.
+    """
+    with open(filename, 'rb') as f:
+        metadata = read_header(f)
+        if start is not None:
+            f.seek(start)
+        size = os.path.getsize(filename) if stop is None else stop
+        for offset, header in _walk(f, size):
+            times, voltages = decode_chunk(header, f.read(header[6]), metadata['quantum'], metadata['period_us'])
+            yield offset, offset + CHUNK_HEADER.size + header[6], times, voltages
+
+
+def iter_compact(filename):
+    """(epoch times, voltages) chunk by chunk."""
+    for _, _, times, voltages in iter_compact_chunks(filename):
+        yield times, voltages
+
+
+def read_compact(filename):
+    """The whole file as (epoch times, voltages)."""
+    parts = list(iter_compact(filename))
+    if not parts:
+        return np.empty(0), np.empty(0)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def _read_journal(filename, metadata):
+    """(epoch times, voltages) of the complete chunks in a journal."""
+    parts = []
+    with open(filename, 'rb') as f:
+        for _, header in _walk(f, os.path.getsize(filename)):
+            try:
+                parts.append(decode_chunk(header, f.read(header[6]), metadata['quantum'], metadata['period_us']))
+            except (zlib.error, ValueError):
+                break  # The flush the power cut interrupted
+    if not parts:
+        return np.empty(0), np.empty(0)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def repair(filename):
+    """
+    Trim a partly written last chunk and append the rows a crashed writer
+    left in its journal; returns (rows, last epoch time or None).
+    """
+    metadata, chunks = scan_chunks(filename)
+    journal = filename + JOURNAL
+    with open(filename, 'rb+') as f:
+        times = None
+        while chunks and times is None:
+            offset, header = chunks[-1]
+            f.seek(offset + CHUNK_HEADER.size)
+            try:
+                times, _ = decode_chunk(header, f.read(header[6]), metadata['quantum'], metadata['period_us'])
+            except (zlib.error, ValueError) as e:
+                # The chunk was being sealed when the power went; its rows are still in the journal
+                logging.warning(f"Dropping torn chunk at byte {offset} of {filename}: {e}")
+                chunks.pop()
+        if chunks:
+            end = offset + CHUNK_HEADER.size + header[6]
+        else:
+            read_header(f)
+            end = f.tell()
+        if end < os.path.getsize(filename):
+            f.truncate(end)
+        rows = sum(header[4] for _, header in chunks)
+        last_time = float(times[-1]) if chunks else None
+
+        if os.path.exists(journal):
+            journal_times, journal_voltages = _read_journal(journal, metadata)
+            if last_time is not None:
+                # Sealed just before the crash, but the journal wasn't emptied yet
+                keep = journal_times > last_time
+                journal_times, journal_voltages = journal_times[keep], journal_voltages[keep]
+            if len(journal_times):
+                f.seek(end)
+                f.write(encode_chunk(journal_times, journal_voltages, metadata['quantum'], metadata['period_us'],
+                                     CODECS[metadata['codec']]))
+                f.flush()
+                os.fsync(f.fileno())
+                rows += len(journal_times)
+                last_time = float(journal_times[-1])
+                logging.info(f"Recovered {len(journal_times)} journaled rows into {filename}")
+    if os.path.exists(journal):
+        os.remove(journal)
+    return rows, last_time
+
+
+def convert_csv(csv_filename, filename=None, quantum=None, frequency=None, chunk_rows=65536, codec=None):
+    """Convert a PDMS_Test_*.csv recording; returns (compact filename, writer)."""
+    import pandas as pd
+    from session_file import parse_timestamps
+
+    filename = filename or csv_filename.rsplit('.', 1)[0] + '.dmmz'
+    metadata = {'source': csv_filename, 'resolution': quantum, 'measurement_frequency': frequency}
+    writer = CompactWriter(filename, metadata, codec=codec, chunk_rows=chunk_rows)
+    for chunk in pd.read_csv(csv_filename, chunksize=chunk_rows, dtype={'timestamp': str, 'voltage': float}):
+        writer.write(parse_timestamps(chunk['timestamp'].to_numpy()), chunk['voltage'].to_numpy())
+    writer.close()
+    logging.info(f"Converted {csv_filename} to {filename}")
+    return filename, writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert recordings to compact session files and inspect them.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help="Convert PDMS_Test CSV files.")
+    convert.add_argument('csv_files', nargs='+')
+    convert.add_argument('--quantum', type=float, default=0.0001, help="Volts per stored step (the DMM resolution).")
+    convert.add_argument('--frequency', type=float, help="Nominal sample rate in Hz.")
+    convert.add_argument('--codec', choices=sorted(CODECS), default='zlib')
+    info = subparsers.add_parser('info', help="Show a compact file's settings and compression ratio.")
+    info.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for csv_filename in args.csv_files:
+            filename, writer = convert_csv(csv_filename, quantum=args.quantum, frequency=args.frequency,
+                                           codec=args.codec)
+            csv_size = os.path.getsize(csv_filename)
+            print(f"{csv_filename} -> {filename}: {writer.rows} samples, {os.path.getsize(filename)} bytes "
+                  f"({csv_size / os.path.getsize(filename):.1f}x smaller than the CSV, {writer.ratio:.1f}x "
+                  f"vs float64), quantization error <= {writer.max_error:.3g} V")
+    else:
+        for filename in args.files:
+            metadata, chunks = scan_chunks(filename)
+            rows = sum(header[4] for _, header in chunks)
+            size = os.path.getsize(filename)
+            print(f"{filename}: {rows} samples in {len(chunks)} chunks, {size} bytes, "
+                  f"{16 * rows / size:.1f}x vs float64, quantum {metadata['quantum']} V, "
+                  f"period {metadata['period_us']} us, {metadata['codec']}")
+
+
+if __name__ == "__main__":
+    main()
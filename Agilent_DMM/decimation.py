@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class _Level:
+    """Ring of the most recent `capacity` (time, min, max) entries."""
+
+    def __init__(self, capacity):
+        self.times = np.empty(capacity)
+        self.lows = np.empty(capacity)
+        self.highs = np.empty(capacity)
+        self.count = 0  # Entries ever appended
+
+    def append(self, times, lows, highs):
+        capacity = len(self.times)
+        if len(times) > capacity:
+            self.count += len(times) - capacity  # Entries that went straight past the ring
+            times, lows, highs = times[-capacity:], lows[-capacity:], highs[-capacity:]
+        head = self.count % capacity
+        n = min(len(times), capacity - head)
+        for ring, values in ((self.times, times), (self.lows, lows), (self.highs, highs)):
+            ring[head:head + n] = values[:n]
+            ring[:len(values) - n] = values[n:]  # Wrapped around the end of the ring
+        self.count += len(times)
+
+    def entries(self):
+        """All retained entries in time order."""
+        capacity = len(self.times)
+        if self.count <= capacity:
+            return self.times[:self.count], self.lows[:self.count], self.highs[:self.count]
+        head = self.count % capacity
+        order = np.r_[head:capacity, 0:head]
+        return self.times[order], self.lows[order], self.highs[order]
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max summary of a growing (time, value) series.
+
+    Level 0 holds raw samples; each level above holds (time, min, max) buckets
+    of `factor` entries of the level below. Every level is a ring of
+    `capacity` entries and a new level is added whenever the top one fills, so
+    the top level always spans the whole session while memory only grows with
+    the log of its length. Appending a block costs amortized O(block), and a
+    query touches at most one level plus a short tail, whatever the session
+    length.
+    """
+
+    def __init__(self, factor=4, capacity=8192):
+        self.factor = factor
+        self.capacity = capacity
+        self.levels = [_Level(capacity)]
+        self.carries = [(np.empty(0), np.empty(0), np.empty(0))]  # Entries not yet summarized one level up
+
+    def __len__(self):
+        return self.levels[0].count
+
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(times):
+            self._push(0, times, values, values)
+
+    def _push(self, k, times, lows, highs):
+        level = self.levels[k]
+        if k == len(self.levels) - 1 and level.count + len(times) > self.capacity:
+            # The top level is about to wrap: start summarizing it, seeded with everything it holds
+            self.levels.append(_Level(self.capacity))
+            self.carries.append((np.empty(0), np.empty(0), np.empty(0)))
+            self.carries[k] = tuple(values.copy() for values in level.entries())  # The ring is about to be overwritten
+        level.append(times, lows, highs)
+        if k == len(self.levels) - 1:
+            return
+
+        carry = self.carries[k]
+        times = np.concatenate((carry[0], times))
+        lows = np.concatenate((carry[1], lows))
+        highs = np.concatenate((carry[2], highs))
+        complete = len(times) // self.factor * self.factor
+        self.carries[k] = (times[complete:], lows[complete:], highs[complete:])
+        if complete:
+            shape = (-1, self.factor)
+            self._push(k + 1, times[:complete:self.factor], lows[:complete].reshape(shape).min(axis=1),
+                       highs[:complete].reshape(shape).max(axis=1))
+
+    def last_time(self):
+        level = self.levels[0]
+        return level.times[(level.count - 1) % self.capacity] if level.count else None
+
+    def window(self, start, stop, max_points=2000):
+        """
+        (times, values) to draw for [start, stop] with at most about max_points
+        points. Buckets come out as (time, min), (time, max) pairs so the line
+        traces the min/max envelope.
+        """
+        for k, level in enumerate(self.levels):
+            times, lows, highs = level.entries()
+            first = np.searchsorted(times, start, side='left')
+            last = np.searchsorted(times, stop, side='right')
+            covers = k == len(self.levels) - 1 or (len(times) and times[0] <= start)
+            if covers and 2 * (last - first) <= max_points:
+                break
+        tails = [self.carries[j] for j in range(k - 1, -1, -1)]  # Newest data not yet summarized into level k
+        times = np.concatenate([times[first:last]] + [tail[0] for tail in tails])
+        lows = np.concatenate([lows[first:last]] + [tail[1] for tail in tails])
+        highs = np.concatenate([highs[first:last]] + [tail[2] for tail in tails])
+        keep = (times >= start) & (times <= stop)
+        times, lows, highs = times[keep], lows[keep], highs[keep]
+
+        group = -(-2 * len(times) // max(max_points, 2))
+        if group > 1:
+            # Even the coarsest level is too dense for this window; merge its buckets on the fly
+            pad = -len(times) % group
+            times = times[::group]
+            lows = np.pad(lows, (0, pad), mode='edge').reshape(-1, group).min(axis=1)
+            highs = np.pad(highs, (0, pad), mode='edge').reshape(-1, group).max(axis=1)
+        return np.repeat(times, 2), np.column_stack((lows, highs)).ravel()
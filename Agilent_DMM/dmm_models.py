@@ -0,0 +1,25 @@
+"""
+Integration settings of the supported Keysight Truevolt DMMs.
+
+On these instruments NPLC and DC voltage resolution are coupled: setting
+either one sets the other, and an NPLC value a model doesn't support is
+coerced to one it does.
+"""
+
+import logging
+
+DEFAULT_MODEL = '34461A'
+
+# NPLC values each model accepts, with the resolution each gives as a fraction of range
+RESOLUTION_PER_RANGE = {
+    '34461A': {0.02: 100e-6, 0.2: 10e-6, 1: 3e-6, 10: 1e-6, 100: 0.3e-6},
+}
+
+
+def resolution_table(model=None):
+    """{nplc: resolution / range} for a model, falling back to the 34461A's."""
+    if model not in RESOLUTION_PER_RANGE:
+        if model:
+            logging.warning(f"No NPLC table for model {model}; using the {DEFAULT_MODEL}'s.")
+        model = DEFAULT_MODEL
+    return RESOLUTION_PER_RANGE[model]
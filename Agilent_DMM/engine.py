@@ -0,0 +1,205 @@
+"""
+Concurrent acquisition from several instruments against one monotonic clock.
+
+Each instrument is driven by its own worker in a thread pool, paced by its own
+DeadlineScheduler, so adding an instrument doesn't divide everyone's sample
+rate. All samples are stamped with `time.monotonic()` and mapped to wall time
+through a single anchor. A merger thread releases them in time order once
+every instrument has reported past them, and writes one
+'timestamp,channel,voltage' stream.
+
+Config:
+    log_file: "rig.log"
+    test_time: 600
+    instruments:
+      - name: flow
+        type: dmm            # AgilentDMM; any AgilentDMM key can be set here
+        driver: pyvisa       # qcodes (default) or raw pyvisa
+        visa_addr: "USB0::0x0957::0x1A07::MY53206340::INSTR"
+        measurement_frequency: 10
+      - name: daq_ai2
+        type: nidaq          # Sample-clocked, drained in blocks
+        channel: "SimDev1/ai2"
+        measurement_frequency: 1000
+      - name: legacy
+        type: kt34400        # Keysight IVI driver
+        visa_addr: "MyVisaAlias"
+
+Top-level keys other than `instruments` are defaults for every instrument.
+
+Usage:
+    python engine.py --config rig.yaml
+"""
+
+import os
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from agilent_dmm import AgilentDMM
+from recorder import MergedCsvRecorder
+from sample_buffer import SampleBuffer
+from backends import Kt34400Backend, NidaqBackend, ReplayBackend
+
+
+BACKENDS = {'dmm': AgilentDMM, 'kt34400': Kt34400Backend, 'nidaq': NidaqBackend, 'replay': ReplayBackend}
+
+
+class AcquisitionEngine:
+    def __init__(self, config):
+        defaults = {key: value for key, value in config.items() if key != 'instruments'}
+        self.names, self.sources, self.frequencies = [], [], []
+        for entry in config['instruments']:
+            settings = {'visa_addr': '', **defaults, **entry}
+            self.names.append(settings.get('name', f"ch{len(self.names)}"))
+            self.sources.append(BACKENDS[settings.get('type', 'dmm')](settings))
+            self.frequencies.append(settings.get('measurement_frequency', 10))
+        self.test_time = config.get('test_time', 9800)
+        self.output_dir = config.get('output_dir', '.')
+        self.flush_interval = config.get('flush_interval', 1.0)
+        self.flush_rows = config.get('flush_rows', 1000)
+        self.recorder_queue_size = config.get('recorder_queue_size', 100)
+        self.buffer_chunk_size = config.get('buffer_chunk_size', 65536)
+        self.buffer_max_chunks = config.get('buffer_max_chunks', 16)
+        self.blocks = queue.Queue()
+        self.stop_flag = threading.Event()
+        self.buffers = []
+        self.recorder = None
+        self.output_filename = ""
+
+        logging.basicConfig(filename=config.get('log_file', 'dmm_test.log'), level=logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setup_instruments(self):
+        """Connect to every instrument in parallel."""
+        with ThreadPoolExecutor(max_workers=len(self.sources)) as executor:
+            for future in [executor.submit(source.setup_instrument) for source in self.sources]:
+                future.result()
+
+    def _acquire(self, channel, start_time):
+        """Worker loop for one instrument; pushes (channel, times, voltages) blocks to the merger."""
+        source = self.sources[channel]
+        scheduler = None
+        try:
+            # Armed inside the try, so the merger always gets this channel's end marker
+            scheduler = source.start_acquisition(self.frequencies[channel], self.test_time)
+            scheduler.start()
+            while (not self.stop_flag.is_set() and not source.finished
+                   and time.monotonic() - start_time < self.test_time):
+                times, voltages = source.read_block()
+                if len(voltages):
+                    self.blocks.put((channel, times, voltages))
+                scheduler.wait(self.stop_flag)
+            times, voltages = source.stop_acquisition()
+            if len(voltages):
+                self.blocks.put((channel, times, voltages))
+        except Exception as e:
+            logging.error(f"Acquisition from {self.names[channel]} failed: {e}")
+        finally:
+            self.blocks.put((channel, None, None))  # This channel will send nothing more
+        return scheduler.report() if scheduler is not None else None
+
+    def _merge(self):
+        """Release samples in time order once every running channel has reported past them."""
+        pending = [[] for _ in self.sources]
+        watermarks = [-np.inf] * len(self.sources)
+        while min(watermarks) < np.inf:
+            channel, times, voltages = self.blocks.get()
+            if times is None:
+                watermarks[channel] = np.inf
+            else:
+                times = np.asarray(times, dtype=np.float64)
+                voltages = np.asarray(voltages, dtype=np.float64)
+                self.buffers[channel].extend(times, voltages)
+                pending[channel].append((times, voltages))
+                watermarks[channel] = times[-1]
+            self._release(pending, min(watermarks))
+
+    def _release(self, pending, horizon):
+        """Write every pending sample at or before horizon, ordered by time across channels."""
+        times, voltages, channels = [], [], []
+        for channel, blocks in enumerate(pending):
+            if not blocks:
+                continue
+            channel_times = np.concatenate([block[0] for block in blocks])
+            channel_voltages = np.concatenate([block[1] for block in blocks])
+            split = np.searchsorted(channel_times, horizon, side='right')
+            times.append(channel_times[:split])
+            voltages.append(channel_voltages[:split])
+            channels.append(np.full(split, channel))
+            pending[channel] = [(channel_times[split:], channel_voltages[split:])] if split < len(channel_times) else []
+        if not times:
+            return
+        times = np.concatenate(times)
+        if len(times) == 0:
+            return
+        order = np.argsort(times, kind='stable')
+        self.recorder.write(times[order], np.concatenate(voltages)[order], np.concatenate(channels)[order])
+
+    def run(self):
+        """Acquire from all instruments until test_time, Enter or a signal."""
+        anchor = (time.time(), time.monotonic())
+        self.buffers = [SampleBuffer(self.buffer_chunk_size, self.buffer_max_chunks, anchor) for _ in self.sources]
+        start_datetime = datetime.fromtimestamp(anchor[0]).strftime("%Y-%m-%d_%H-%M-%S")
+        self.output_filename = os.path.join(self.output_dir, f"PDMS_Multi_{start_datetime}.csv")
+        self.recorder = MergedCsvRecorder(self.output_filename, self.buffers[0], self.names, self.flush_interval,
+                                          self.flush_rows, self.recorder_queue_size)
+        self.recorder.start()
+
+        merger = threading.Thread(target=self._merge, name='merger', daemon=True)
+        merger.start()
+        with ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix='acquisition') as executor:
+            futures = [executor.submit(self._acquire, channel, anchor[1]) for channel in range(len(self.sources))]
+            reports = [future.result() for future in futures]
+        merger.join()
+        self.recorder.close()
+
+        elapsed = time.monotonic() - anchor[1]
+        for name, buffer, report in zip(self.names, self.buffers, reports):
+            if report is None:
+                logging.warning(f"{name}: acquisition never started.")
+                continue
+            logging.info(f"{name}: {len(buffer)} samples, {len(buffer) / elapsed:.2f} samples/s, "
+                         f"lateness p99 {report['lateness_p99_ms']:.2f} ms")
+        return reports
+
+    def stop(self, signum=None, frame=None):
+        self.stop_flag.set()
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquire from several instruments on one time base.")
+    parser.add_argument('--config', type=str, default='rig.yaml', help="Path to the multi-instrument config.")
+    args = parser.parse_args()
+
+    engine = AcquisitionEngine(AgilentDMM.load_config(args.config))
+    signal.signal(signal.SIGINT, engine.stop)
+    signal.signal(signal.SIGTERM, engine.stop)
+
+    def wait_for_user_input():
+        input("Press Enter to stop the test...\n")
+        engine.stop()
+
+    threading.Thread(target=wait_for_user_input, daemon=True).start()
+
+    try:
+        engine.setup_instruments()
+        engine.run()
+        print(f"Data saved to {engine.output_filename}")
+    except Exception as e:
+        logging.error(f"Failed to perform measurements: {e}")
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import time
+import logging
+
+
+def _bucket(ns):
+    """Histogram bucket for a duration: exact below 8 ns, then four buckets per power of two."""
+    if ns < 8:
+        return max(ns, 0)
+    bits = ns.bit_length()
+    return 8 + (bits - 4) * 4 + ((ns >> (bits - 3)) & 3)
+
+
+def _bucket_midpoint(index):
+    if index < 8:
+        return float(index)
+    bits, sub = divmod(index - 8, 4)
+    shift = bits + 1
+    return ((4 + sub) << shift) + (1 << shift) / 2
+
+
+class StageTimer:
+    """
+    Opt-in per-stage timing of the acquisition hot path.
+
+    Each stage keeps a fixed 256-bucket histogram of `perf_counter_ns`
+    durations (about 9% resolution), so recording costs a couple of integer
+    operations and memory never grows. Percentiles come from the bucket
+    midpoints.
+
+    Usage:
+        t = timer.start()
+        read()
+        t = timer.lap('read', t)
+        record()
+        t = timer.lap('record', t)
+    """
+
+    def __init__(self, log_interval=60.0):
+        self.log_interval = log_interval
+        self.histograms = {}
+        self.totals = {}
+        self.maxima = {}
+        self.next_log = time.monotonic() + log_interval
+
+    @staticmethod
+    def start():
+        return time.perf_counter_ns()
+
+    def lap(self, stage, started):
+        """Record the time since `started` against `stage`; returns now, to start the next stage."""
+        now = time.perf_counter_ns()
+        elapsed = now - started
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = [0] * 256
+            self.totals[stage] = 0
+            self.maxima[stage] = 0
+        histogram[_bucket(elapsed)] += 1
+        self.totals[stage] += elapsed
+        if elapsed > self.maxima[stage]:
+            self.maxima[stage] = elapsed
+        return now
+
+    def percentiles(self, stage, quantiles=(0.5, 0.95, 0.99)):
+        """Approximate percentiles in microseconds, never above the observed maximum."""
+        histogram = self.histograms[stage]
+        count = sum(histogram)
+        maximum = self.maxima[stage]
+        results = []
+        for quantile in quantiles:
+            target = quantile * count
+            seen = 0
+            for index, n in enumerate(histogram):
+                seen += n
+                if n and seen >= target:
+                    results.append(min(_bucket_midpoint(index), maximum) / 1e3)
+                    break
+            else:
+                results.append(0.0)
+        return results
+
+    def report(self):
+        """{stage: {count, mean_us, p50_us, p95_us, p99_us, max_us}} for the run so far."""
+        report = {}
+        for stage, histogram in list(self.histograms.items()):
+            count = sum(histogram)
+            p50, p95, p99 = self.percentiles(stage)
+            report[stage] = {
+                'count': count,
+                'mean_us': self.totals[stage] / count / 1e3 if count else 0.0,
+                'p50_us': p50,
+                'p95_us': p95,
+                'p99_us': p99,
+                'max_us': self.maxima[stage] / 1e3,
+            }
+        return report
+
+    def log_report(self):
+        for stage, stats in self.report().items():
+            logging.info(f"Stage {stage}: n={stats['count']} mean={stats['mean_us']:.1f} "
+                         f"p50={stats['p50_us']:.1f} p95={stats['p95_us']:.1f} "
+                         f"p99={stats['p99_us']:.1f} max={stats['max_us']:.1f} us")
+
+    def maybe_log(self):
+        """Log the running report every log_interval seconds."""
+        now = time.monotonic()
+        if now >= self.next_log:
+            self.next_log = now + self.log_interval
+            self.log_report()
+
+
+class NullTimer:
+    """Stand-in used when instrumentation is off; every call is a no-op."""
+
+    @staticmethod
+    def start():
+        return 0
+
+    @staticmethod
+    def lap(stage, started):
+        return 0
+
+    def report(self):
+        return {}
+
+    def log_report(self):
+        pass
+
+    def maybe_log(self):
+        pass
@@ -0,0 +1,146 @@
+import time
+import queue
+import numpy as np
+import matplotlib.pyplot as plt
+from decimation import MinMaxPyramid
+from instrumentation import NullTimer
+
+
+class LivePlot:
+    """
+    Fixed frame-rate plot consumer fed by the acquisition thread through a bounded queue.
+
+    Samples go into a MinMaxPyramid, so every frame draws at most `max_points`
+    points, whether it shows the whole session, the last `window` seconds, or
+    a range the user zoomed to with the toolbar. Zooming or panning stops the
+    view from following new data; pressing 'f' resumes it.
+    """
+
+    def __init__(self, max_points=100, fps=10, queue_size=1000, window=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frame_interval = 1 / fps
+        self.max_points = max_points
+        self.window = window  # Seconds to follow; None shows the whole session
+        self.pyramid = MinMaxPyramid()
+        self.follow = True
+        self.drawn_xlim = None
+        self.dropped_blocks = 0
+        self.start_time = 0.0
+        self.fig = None
+        self.timer = NullTimer()  # StageTimer for the 'render' stage
+
+    def publish(self, timestamps, readings):
+        """Hand a block of samples to the plot without ever blocking the producer."""
+        while True:
+            try:
+                self.queue.put_nowait((timestamps, readings))
+                return
+            except queue.Full:
+                # The plot is behind; throw away its oldest block rather than stall acquisition
+                try:
+                    self.queue.get_nowait()
+                    self.dropped_blocks += 1
+                except queue.Empty:
+                    pass
+
+    def open(self, start_time):
+        """Create the figure and cache the static background for blitting."""
+        self.start_time = start_time
+        plt.ion()  # Turn on interactive mode
+        self.fig, self.ax = plt.subplots()
+        self.line, = self.ax.plot([], [], 'b-', label='Voltage (V)', animated=True)
+        self.ax.set_xlabel('Time (s)')
+        self.ax.set_ylabel('Voltage (V)')
+        self.ax.set_title('Live Voltage Measurement')
+        self.ax.grid(True)
+        self.ax.legend()
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.mpl_connect('key_press_event', self._on_key)
+        plt.show(block=False)
+        self._redraw()
+
+    def _redraw(self):
+        """Full redraw, needed only when the axes limits change."""
+        self.fig.canvas.draw()
+
+    def _on_draw(self, event):
+        # Any full draw, ours or a toolbar zoom, invalidates the cached background
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def _on_key(self, event):
+        if event.key == 'f':
+            self.follow = True
+            self.drawn_xlim = None
+
+    def _drain(self):
+        """Pull every block that arrived since the last frame."""
+        received = False
+        while True:
+            try:
+                timestamps, readings = self.queue.get_nowait()
+            except queue.Empty:
+                return received
+            if len(readings):
+                self.pyramid.extend(np.asarray(timestamps) - self.start_time, readings)
+                received = True
+
+    def _follow_xlim(self):
+        """Grow (or slide) the x axis with some headroom once the data leaves the visible area."""
+        xmin, xmax = self.ax.get_xlim()
+        tmax = self.pyramid.last_time()
+        if tmax <= xmax and (self.window is not None or xmin <= 0.0):
+            return False
+        if self.window is None:
+            self.ax.set_xlim(0.0, 1.5 * max(tmax, self.frame_interval))
+        else:
+            self.ax.set_xlim(tmax - self.window, tmax + 0.5 * self.window)
+        return True
+
+    def _grow_ylim(self, voltages):
+        """Grow the y axis with some headroom once the data leaves the visible area."""
+        if len(voltages) == 0:
+            return False
+        ymin, ymax = self.ax.get_ylim()
+        vmin, vmax = voltages.min(), voltages.max()
+        changed = False
+        if vmin < ymin or vmax > ymax:
+            margin = max(vmax - vmin, abs(vmax) * 1e-6, 1e-9) * 0.25
+            self.ax.set_ylim(vmin - margin, vmax + margin)
+            changed = True
+        return changed
+
+    def update(self):
+        """Render one frame with whatever samples are pending."""
+        started = self.timer.start()
+        received = self._drain()
+        if self.follow and self.drawn_xlim is not None and self.ax.get_xlim() != self.drawn_xlim:
+            self.follow = False  # The user zoomed or panned; leave the view where they put it
+        if len(self.pyramid) and (received or self.ax.get_xlim() != self.drawn_xlim):
+            changed = self.follow and self._follow_xlim()
+            xmin, xmax = self.ax.get_xlim()
+            times, voltages = self.pyramid.window(xmin, xmax, self.max_points)
+            self.line.set_data(times, voltages)
+            changed = self._grow_ylim(voltages) or changed
+            self.drawn_xlim = self.ax.get_xlim()
+            if changed:
+                self._redraw()
+            self.fig.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.fig.canvas.blit(self.ax.bbox)
+        self.fig.canvas.flush_events()
+        self.timer.lap('render', started)
+
+    def run(self, stop_flag):
+        """Redraw at the configured frame rate until stop_flag is set."""
+        next_frame = time.perf_counter()
+        while not stop_flag.is_set():
+            self.update()
+            next_frame += self.frame_interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                stop_flag.wait(delay)
+            else:
+                next_frame = time.perf_counter()  # Rendering overran; don't try to catch up
+
+    def close(self):
+        plt.close('all')
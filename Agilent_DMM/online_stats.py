@@ -0,0 +1,149 @@
+import math
+from collections import deque
+import numpy as np
+
+
+class RollingExtrema:
+    """
+    Min and max over the last `window` seconds, kept as `buckets` fixed-width
+    time buckets. The window edge is accurate to one bucket width and memory
+    doesn't depend on the sample rate.
+    """
+
+    def __init__(self, window, buckets=16):
+        self.window = window
+        self.width = window / buckets
+        self.buckets = deque(maxlen=buckets + 1)  # [bucket id, min, max]
+
+    def update(self, times, voltages):
+        ids = np.floor(times / self.width).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+        lows = np.minimum.reduceat(voltages, starts)
+        highs = np.maximum.reduceat(voltages, starts)
+        keep = slice(-self.buckets.maxlen, None)  # Older buckets would fall out of the deque anyway
+        for bucket, low, high in zip(ids[starts][keep].tolist(), lows[keep].tolist(), highs[keep].tolist()):
+            if self.buckets and self.buckets[-1][0] == bucket:
+                last = self.buckets[-1]
+                last[1] = min(last[1], low)
+                last[2] = max(last[2], high)
+            else:
+                self.buckets.append([bucket, low, high])
+
+    def extrema(self, now):
+        oldest = math.floor((now - self.window) / self.width)
+        current = [bucket for bucket in list(self.buckets) if bucket[0] >= oldest]
+        if not current:
+            return math.nan, math.nan
+        return min(bucket[1] for bucket in current), max(bucket[2] for bucket in current)
+
+
+class SettlingDetector:
+    """
+    Fires 'settled' once every reading for `duration` seconds has stayed within
+    a band of +/- `tolerance` volts, and 'unsettled' when a reading leaves it.
+    Only the current run (its start time and extremes) is kept.
+    """
+
+    def __init__(self, tolerance, duration):
+        self.tolerance = tolerance
+        self.duration = duration
+        self.settled = False
+        self.run_start = None
+        self.low = math.inf
+        self.high = -math.inf
+
+    def update(self, times, voltages):
+        """Returns [(monotonic time, 'settled' | 'unsettled', volts)] for transitions in this block."""
+        if self.run_start is None:
+            self.run_start = float(times[0])
+        low = min(self.low, float(voltages.min()))
+        high = max(self.high, float(voltages.max()))
+        if high - low <= 2 * self.tolerance:
+            # Whole block inside the band; only the settle time can change
+            self.low, self.high = low, high
+            if not self.settled and times[-1] - self.run_start >= self.duration:
+                self.settled = True
+                at = int(np.searchsorted(times, self.run_start + self.duration))
+                return [(float(times[at]), 'settled', (low + high) / 2)]
+            return []
+
+        events = []
+        for t, v in zip(times.tolist(), voltages.tolist()):
+            low = min(self.low, v)
+            high = max(self.high, v)
+            if high - low > 2 * self.tolerance:
+                if self.settled:
+                    self.settled = False
+                    events.append((t, 'unsettled', v))
+                self.run_start, self.low, self.high = t, v, v
+            else:
+                self.low, self.high = low, high
+                if not self.settled and t - self.run_start >= self.duration:
+                    self.settled = True
+                    events.append((t, 'settled', (low + high) / 2))
+        return events
+
+
+class OnlineStats:
+    """
+    Running statistics over an unbounded stream in constant memory.
+
+    Blocks are folded in as they are recorded: Welford mean/variance (merged
+    per block with Chan's update), an exponentially weighted moving average
+    with a time constant in seconds, rolling min/max over each of `windows`
+    seconds, and optionally a SettlingDetector.
+    """
+
+    def __init__(self, windows=(10, 60), ewma_time_constant=1.0, settle_tolerance=None, settle_time=30.0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma_time_constant = ewma_time_constant
+        self.ewma = math.nan
+        self.last_time = None
+        self.extrema = {window: RollingExtrema(window) for window in windows}
+        self.settling = SettlingDetector(settle_tolerance, settle_time) if settle_tolerance else None
+
+    def update(self, times, voltages):
+        """Fold in a block of monotonic times and voltages; returns any settling events."""
+        times = np.asarray(times, dtype=np.float64)
+        voltages = np.asarray(voltages, dtype=np.float64)
+        n = len(voltages)
+        if n == 0:
+            return []
+
+        block_mean = float(voltages.mean())
+        block_m2 = float(np.square(voltages - block_mean).sum())
+        delta = block_mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.m2 += block_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        if self.last_time is None:
+            self.ewma, self.last_time = float(voltages[0]), float(times[0])
+        # Closed form of the per-sample recursion with alpha = 1 - exp(-dt / tau)
+        intervals = np.diff(times, prepend=self.last_time)
+        alphas = -np.expm1(-intervals / self.ewma_time_constant)
+        decay = np.exp(-(times[-1] - times) / self.ewma_time_constant)
+        self.ewma = (self.ewma * math.exp(-(times[-1] - self.last_time) / self.ewma_time_constant)
+                     + float(np.dot(alphas * decay, voltages)))
+        self.last_time = float(times[-1])
+
+        for extrema in self.extrema.values():
+            extrema.update(times, voltages)
+        return self.settling.update(times, voltages) if self.settling is not None else []
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self):
+        """Current values as a flat dict."""
+        summary = {'count': self.count, 'mean': self.mean, 'std': self.std, 'ewma': self.ewma}
+        now = self.last_time if self.last_time is not None else 0.0
+        for window, extrema in self.extrema.items():
+            summary[f'min_{window:g}s'], summary[f'max_{window:g}s'] = extrema.extrema(now)
+        if self.settling is not None:
+            summary['settled'] = self.settling.settled
+        return summary
@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from instrumentation import NullTimer
+
+
+class Recorder:
+    """Background writer that appends blocks of samples to disk in batches.
+
+    Blocks are handed over through a bounded queue and written by a dedicated
+    thread. Pending rows are flushed and fsync'd whenever `flush_rows` have
+    accumulated or `flush_interval` seconds have passed, so a crash loses at
+    most one flush interval of data.
+    """
+
+    def __init__(self, filename, samples, flush_interval=1.0, flush_rows=1000, queue_size=100, metadata=None):
+        self.filename = filename
+        self.samples = samples  # SampleBuffer the blocks come from, for its time anchor
+        self.metadata = metadata or {}
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.rows_written = 0
+        self.thread = None
+        self.timer = NullTimer()  # StageTimer for the 'format', 'write' and 'flush' stages
+        self.stats = None  # OnlineStats fed with every batch before it is written
+
+    def start(self):
+        self._open()
+        self.thread = threading.Thread(target=self._run, name='recorder')
+        self.thread.start()
+
+    def write(self, *columns):
+        """Queue a block of column arrays; blocks only if the disk falls a whole queue behind."""
+        try:
+            self.queue.put_nowait(columns)
+        except queue.Full:
+            logging.warning("Recorder queue full, acquisition waiting on disk.")
+            self.queue.put(columns)
+
+    def close(self):
+        """Write everything still queued and close the file."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        logging.info(f"Data saved to {self.filename} ({self.rows_written} rows)")
+
+    def _run(self):
+        pending_blocks = []
+        pending = 0
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                block = self.queue.get(timeout=timeout)
+                if block is None:
+                    running = False
+                else:
+                    pending_blocks.append(block)
+                    pending += len(block[0])
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if not running or pending >= self.flush_rows or now - last_flush >= self.flush_interval:
+                try:
+                    if pending:
+                        columns = [np.concatenate(column) for column in zip(*pending_blocks)]
+                        if self.stats is not None:
+                            started = self.timer.start()
+                            events = self.stats.update(columns[0], columns[1])
+                            self.timer.lap('stats', started)
+                            if events:
+                                self._record_events(events)
+                        self._write_rows(*columns)
+                        self.rows_written += pending
+                    started = self.timer.start()
+                    self._flush()
+                    self.timer.lap('flush', started)
+                except Exception as e:
+                    logging.error(f"Recorder failed to write to {self.filename}: {e}")
+                pending_blocks = []
+                pending = 0
+                last_flush = now
+        self._close_file()
+
+    def _record_events(self, events):
+        """Log (monotonic time, kind, value) events and store them with the session."""
+        times = np.array([event[0] for event in events])
+        timestamps = self.samples.format_timestamps(times)
+        kinds = [event[1] for event in events]
+        values = [event[2] for event in events]
+        for timestamp, kind, value in zip(timestamps, kinds, values):
+            logging.info(f"Signal {kind} at {timestamp} ({value:.7g} V)")
+        self._write_events(times, kinds, values)
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_rows(self, times, voltages):
+        raise NotImplementedError
+
+    def _write_events(self, times, kinds, values):
+        pass
+
+    def _write_events_sidecar(self, times, kinds, values):
+        """Events in '<data file>.events.csv', for formats with no place for them in the data file."""
+        if self.events_file is None:
+            self.events_file = open(os.path.splitext(self.filename)[0] + '.events.csv', 'w', newline='')
+            self.events_file.write('timestamp,event,voltage\n')
+        timestamps = self.samples.format_timestamps(times)
+        self.events_file.writelines(f'{t},{k},{v!r}\n' for t, k, v in zip(timestamps, kinds, values))
+        self.events_file.flush()
+
+    def _flush(self):
+        raise NotImplementedError
+
+    def _close_file(self):
+        raise NotImplementedError
+
+
+class CsvRecorder(Recorder):
+    """Streams 'timestamp,voltage' rows in the same layout as the old pandas export."""
+
+    def start(self):
+        # The CSV has no header room for settings, so they go to '<data file>.meta.json'.
+        # Segments are opened without start(); their metadata is in the manifest.
+        if self.metadata:
+            with open(os.path.splitext(self.filename)[0] + '.meta.json', 'w') as f:
+                json.dump(self.metadata, f, indent=2, default=str)
+        super().start()
+
+    def _open(self):
+        self.file = open(self.filename, 'w', newline='')
+        self.file.write('timestamp,voltage\n')
+        self.events_file = None
+
+    def _write_rows(self, times, voltages):
+        started = self.timer.start()
+        timestamps = self.samples.format_timestamps(times)
+        rows = [f'{t},{v!r}\n' for t, v in zip(timestamps, voltages.tolist())]
+        started = self.timer.lap('format', started)
+        self.file.writelines(rows)
+        self.timer.lap('write', started)
+
+    def _write_events(self, times, kinds, values):
+        # Events go to a sidecar so the sample CSV keeps its two-column layout
+        self._write_events_sidecar(times, kinds, values)
+
+    def _flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _close_file(self):
+        self.file.close()
+        if self.events_file is not None:
+            self.events_file.close()
+
+
+class MergedCsvRecorder(CsvRecorder):
+    """Time-ordered 'timestamp,channel,voltage' rows from several instruments."""
+
+    def __init__(self, filename, samples, channel_names, *args, **kwargs):
+        super().__init__(filename, samples, *args, **kwargs)
+        self.channel_names = np.array(channel_names)
+
+    def _open(self):
+        self.file = open(self.filename, 'w', newline='')
+        self.file.write('timestamp,channel,voltage\n')
+        self.events_file = None
+
+    def _write_rows(self, times, voltages, channels):
+        timestamps = self.samples.format_timestamps(times)
+        names = self.channel_names[channels]
+        self.file.writelines(f'{t},{c},{v!r}\n' for t, c, v in zip(timestamps, names, voltages.tolist()))
+
+
+class Hdf5Recorder(Recorder):
+    """Appends to chunked HDF5 columns with session metadata and a coarse time index."""
+
+    chunk_rows = 16384
+    index_interval = 60.0  # Seconds between time index entries
+
+    def _open(self):
+        from session_file import create_session  # h5py is only needed for this format
+
+        self.file = create_session(self.filename, self.metadata, self.chunk_rows)
+
+    def _write_rows(self, times, voltages):
+        from session_file import append_samples
+
+        started = self.timer.start()
+        append_samples(self.file, self.samples.to_wall(times), voltages, self.index_interval)
+        self.timer.lap('write', started)
+
+    def _write_events(self, times, kinds, values):
+        from session_file import append_events
+
+        append_events(self.file, self.samples.to_wall(times), kinds, values)
+
+    def _flush(self):
+        self.file.flush()
+
+    def _close_file(self):
+        self.file.close()
+
+
+class CompactRecorder(Recorder):
+    """
+    Writes quantized, delta-encoded, compressed chunks (see compact_file.py).
+    Flushes go to the writer's journal until a chunk is full, so chunk size
+    doesn't depend on flush_interval.
+    """
+
+    def _open(self):
+        from compact_file import CompactWriter
+
+        self.file = CompactWriter(self.filename, self.metadata)
+        self.events_file = None
+
+    def _write_rows(self, times, voltages):
+        started = self.timer.start()
+        self.file.write(self.samples.to_wall(times), voltages)
+        self.timer.lap('format', started)
+
+    def _flush(self):
+        started = self.timer.start()
+        self.file.flush()
+        self.timer.lap('write', started)
+
+    def _write_events(self, times, kinds, values):
+        # Chunks only hold samples, so events go to the same sidecar as for CSV
+        self._write_events_sidecar(times, kinds, values)
+
+    def _close_file(self):
+        self.file.close()
+        if self.events_file is not None:
+            self.events_file.close()
+        if self.file.rows:
+            logging.info(f"Compact file {self.filename}: {self.file.rows} samples in {self.file.bytes} bytes, "
+                         f"{self.file.ratio:.1f}x smaller than float64, quantization error <= "
+                         f"{self.file.max_error:.3g} V")
+
+
+class SegmentedRecorder(Recorder):
+    """
+    Writes a session as rotating segment files plus a manifest (see segments.py).
+
+    `filename` is the session directory. Each segment is written through the
+    hooks of `segment_class` (CsvRecorder or Hdf5Recorder) and a new one is
+    started every `segment_interval` seconds, or once the segment file reaches
+    `max_bytes`. After each fsync'd flush the manifest is updated, so a crash
+    loses at most one flush interval. With `resume`, an existing incomplete
+    session in `filename` is reconciled and continued under the same session
+    id in a new segment. `retention` (keyword arguments of
+    segments.apply_retention) is applied at every rotation to the finished
+    segments of this session and of every other session beside it. It runs
+    on a separate 'retention' thread so downsampling never holds up writing.
+    The writer only applies the result to the manifest at its next flush.
+    """
+
+    def __init__(self, filename, samples, segment_class, extension, segment_interval=3600.0, *args,
+                 resume=False, max_bytes=None, retention=None, **kwargs):
+        super().__init__(filename, samples, *args, **kwargs)
+        self.segment_class = segment_class
+        self.extension = extension
+        self.segment_interval = segment_interval
+        self.resume = resume
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self.segment = None
+        self.manifest = None
+        self.retainer = None  # Thread running retention
+        self.retained = queue.Queue()  # (updates, removed) from segments.plan_retention for this session
+
+    def _open(self):
+        import segments
+
+        if self.resume:
+            self.manifest = segments.reconcile(self.filename, segments.read_manifest(self.filename))
+            self.manifest.setdefault('resumed', []).append(self.metadata.get('start_time'))
+            logging.info(f"Resuming session {self.manifest['session_id']} after "
+                         f"{sum(segment['rows'] for segment in self.manifest['segments'])} rows.")
+        else:
+            os.makedirs(self.filename, exist_ok=True)
+            self.manifest = {
+                'session_id': os.path.basename(self.filename),
+                'extension': self.extension,
+                'status': 'recording',
+                'metadata': self.metadata,
+                'segments': [],
+            }
+        self.manifest['status'] = 'recording'
+        self._start_segment()
+
+    def _start_segment(self):
+        import segments
+
+        if self.retention and (self.retainer is None or not self.retainer.is_alive()):
+            complete = [dict(segment) for segment in self.manifest['segments'] if segment['complete']]
+            self.retainer = threading.Thread(target=self._retain, args=(complete,), name='retention', daemon=True)
+            self.retainer.start()
+        # Retention drops old entries, so rows and numbering continue from the last segment
+        last = self.manifest['segments'][-1] if self.manifest['segments'] else None
+        first_row = last['first_row'] + last.get('full_rows', last['rows']) if last else 0
+        number = self.manifest.get('segment_count', len(self.manifest['segments']))
+        self.manifest['segment_count'] = number + 1
+        name = segments.segment_name(number, self.extension)
+        self.segment = self.segment_class(os.path.join(self.filename, name), self.samples, metadata=self.metadata)
+        self.segment.timer = self.timer
+        self.segment._open()
+        self.manifest['segments'].append({'file': name, 'first_row': first_row, 'rows': 0,
+                                          'start_time': None, 'end_time': None, 'complete': False})
+        self._write_manifest()
+
+    def _retain(self, complete):
+        """Retention thread: downsample this session's due segments, then age out the other sessions."""
+        import segments
+
+        try:
+            result = segments.plan_retention(self.filename, complete, self.segment_class, self.manifest['metadata'],
+                                             **self.retention)
+            if result[1]:
+                self.retained.put(result)
+            # Earlier runs' sessions, including ones a crash or restart left 'recording'
+            segments.apply_retention_all(os.path.dirname(self.filename) or '.', self.filename, **self.retention)
+        except Exception as e:
+            logging.error(f"Retention failed for {self.filename}: {e}")
+
+    def _write_manifest(self):
+        """Write the manifest, with any retention results applied first."""
+        import segments
+
+        while not self.retained.empty():
+            segments.commit_retention(self.filename, self.manifest, *self.retained.get())
+        segments.write_manifest(self.filename, self.manifest)
+
+    def _finish_segment(self):
+        self.segment._flush()
+        self.segment._close_file()
+        self.manifest['segments'][-1]['complete'] = True
+
+    def _write_rows(self, times, voltages):
+        wall = self.samples.to_wall(times[[0, -1]])
+        current = self.manifest['segments'][-1]
+        # Rotate on sample time or file size, at batch boundaries
+        if current['start_time'] is not None and (
+                wall[0] - current['start_time'] >= self.segment_interval or
+                self.max_bytes and os.path.getsize(self.segment.filename) >= self.max_bytes):
+            self._finish_segment()
+            self._start_segment()
+            current = self.manifest['segments'][-1]
+        self.segment._write_rows(times, voltages)
+        if current['start_time'] is None:
+            current['start_time'] = float(wall[0])
+        current['end_time'] = float(wall[1])
+        current['rows'] += len(times)
+
+    def _write_events(self, times, kinds, values):
+        self.segment._write_events(times, kinds, values)
+
+    def _flush(self):
+        self.segment._flush()
+        # Only after the data is on disk may the manifest claim it
+        self._write_manifest()
+
+    def _close_file(self):
+        self._finish_segment()
+        if self.retainer is not None:
+            self.retainer.join()
+        self.manifest['status'] = 'complete'
+        self._write_manifest()
+
+
+RECORDERS = {'csv': (CsvRecorder, '.csv'), 'hdf5': (Hdf5Recorder, '.h5'), 'compact': (CompactRecorder, '.dmmz')}
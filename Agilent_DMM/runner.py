@@ -0,0 +1,223 @@
+"""
+Batch runner for several test rigs, one AgilentDMM session per worker process.
+
+Each rig is an ordinary config.yaml. Every rig runs headless in its own
+process, so a slow or crashing rig can't stall the others. Its relative
+output_dir, log_file and profile_cache paths are placed under
+`<output root>/<rig name>/`, which keeps logs, profile caches and recordings
+apart. Workers connect to their instruments first and all start recording
+together once every rig is ready. The runner owns the console: Enter, Ctrl-C
+or SIGTERM stops every rig cleanly. While they run it shows one status line
+per rig with its achieved sample rate and backlog, the samples acquired but
+not yet written to disk.
+
+Usage:
+    python runner.py rig_a.yaml rig_b.yaml --output-root runs
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from agilent_dmm import AgilentDMM
+
+PATH_DEFAULTS = {'output_dir': '.', 'log_file': 'dmm_test.log', 'profile_cache': '.dmm_profile_cache.json'}
+UNIQUE_KEYS = ('visa_addr', 'shared_ring', 'stream_port')  # Two rigs can't share these
+
+
+def rig_configs(config_files, output_root):
+    """(name, config) per rig file, with each rig's relative paths moved under output_root/name."""
+    rigs = []
+    for config_file in config_files:
+        config = AgilentDMM.load_config(config_file)
+        name = config.get('name') or os.path.splitext(os.path.basename(config_file))[0]
+        if any(name == existing for existing, _ in rigs):
+            name = f"{name}_{len(rigs)}"
+        directory = os.path.join(output_root, name)
+        for key, default in PATH_DEFAULTS.items():
+            path = config.get(key, default)
+            config[key] = path if os.path.isabs(path) else os.path.normpath(os.path.join(directory, path))
+        config['headless'] = True
+        rigs.append((name, config))
+
+    for key in UNIQUE_KEYS:
+        seen = {}
+        for name, config in rigs:
+            value = config.get(key)
+            if value is None or (key == 'visa_addr' and config.get('simulate')):
+                continue
+            if value in seen:
+                raise ValueError(f"Rigs {seen[value]} and {name} both use {key} {value!r}")
+            seen[value] = name
+    return rigs
+
+
+def run_rig(name, config, start, stop, status, status_interval):
+    """
+    Worker process: connect, wait for the common start, record until stopped
+    or test_time. Connecting, reconnects after read errors, daemon sessions
+    (no time limit, segmented, resumed) and saving go through the same
+    AgilentDMM methods as a single run of agilent_dmm.py.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The runner stops us through `stop`
+    os.makedirs(config['output_dir'], exist_ok=True)
+    os.makedirs(os.path.dirname(config['log_file']) or '.', exist_ok=True)
+    frequency = config.get('measurement_frequency', 10)
+    dmm = AgilentDMM(config)
+    test_time = dmm.test_time  # Unlimited for a daemon rig
+
+    def report(state, **values):
+        status.put(dict(values, rig=name, state=state, target=frequency))
+
+    finished = threading.Event()
+
+    def forward_stop():
+        # Polled: a process that exits inside stop.wait() leaves the runner's stop.set() waiting for it forever
+        while not finished.wait(0.1):
+            if stop.is_set():
+                dmm.stop_flag.set()  # Ends a connect() retry loop; the status loop covers a session started since
+
+    forwarder = threading.Thread(target=forward_stop, daemon=True)
+    forwarder.start()
+    try:
+        report('connecting')
+        # Same connect path as agilent_dmm.py: retried with backoff when the rig sets reconnect or daemon
+        if not dmm.open_instrument():
+            report('stopped', samples=0)
+            return
+        report('ready')
+        start.wait()
+        if stop.is_set():
+            report('stopped', samples=0)
+            return
+        start_time = dmm.start_session(frequency)
+        dmm.acquisition_thread = threading.Thread(target=dmm.acquire, args=(frequency, test_time, start_time),
+                                                  name='acquisition')
+        dmm.acquisition_thread.start()
+        last_count, last_time = 0, start_time
+        while dmm.acquisition_thread.is_alive():
+            dmm.acquisition_thread.join(min(status_interval, 0.1))
+            if stop.is_set():
+                dmm.stop_flag.set()
+            now = time.monotonic()
+            if now - last_time < status_interval:
+                continue
+            count = len(dmm.samples)
+            report('recording', elapsed=now - start_time, samples=count,
+                   rate=(count - last_count) / (now - last_time), backlog=count - dmm.recorder.rows_written,
+                   last=float(dmm.samples[count - 1:count][1][0]) if count else None, reconnects=dmm.reconnects)
+            last_count, last_time = count, now
+        elapsed = time.monotonic() - start_time
+        dmm.save_data()
+        report('done', elapsed=elapsed, samples=len(dmm.samples), rate=len(dmm.samples) / elapsed, backlog=0,
+               file=dmm.output_filename, reconnects=dmm.reconnects)
+    except Exception as e:
+        logging.error(f"Rig {name} failed: {e}")
+        report('failed', error=str(e))
+    finally:
+        finished.set()
+        forwarder.join()
+        dmm.close()
+
+
+class BatchRunner:
+    """Starts one worker process per rig and collects their status reports."""
+
+    def __init__(self, rigs, status_interval=1.0):
+        self.rigs = rigs
+        self.status_interval = status_interval
+        # Fresh interpreters: no inherited threads, logging handlers or signal handlers
+        context = multiprocessing.get_context('spawn')
+        self.start_event = context.Event()
+        self.stop_event = context.Event()
+        self.status = context.Queue()
+        self.processes = [context.Process(target=run_rig, name=f'rig-{name}',
+                                          args=(name, config, self.start_event, self.stop_event,
+                                                self.status, status_interval))
+                          for name, config in rigs]
+        self.latest = {name: {'rig': name, 'state': 'starting', 'target': config.get('measurement_frequency', 10)}
+                       for name, config in rigs}
+
+    def stop(self, signum=None, frame=None):
+        self.stop_event.set()
+        self.start_event.set()  # Release rigs still waiting to start
+
+    def run(self):
+        for process in self.processes:
+            process.start()
+        # Start together once every rig is connected; failed rigs don't hold up the others
+        while any(row['state'] in ('starting', 'connecting') and process.is_alive()
+                  for row, process in zip(self.latest.values(), self.processes)):
+            time.sleep(min(self.status_interval, 0.1))
+            self._collect()
+        self.start_event.set()
+        while any(process.is_alive() for process in self.processes):
+            time.sleep(self.status_interval)
+            self._collect()
+            self.show()
+        for process in self.processes:
+            process.join()
+        self._collect()
+        for name, process in zip(self.latest, self.processes):
+            if process.exitcode and self.latest[name]['state'] not in ('done', 'failed'):
+                self.latest[name].update(state='failed', error=f"exit code {process.exitcode}")
+        self.show()
+        return self.latest
+
+    def _collect(self):
+        while True:
+            try:
+                update = self.status.get_nowait()
+            except queue.Empty:
+                return
+            self.latest[update['rig']].update(update)
+
+    def table(self):
+        lines = [f"{'rig':<16} {'state':<10} {'elapsed':>9} {'samples':>10} {'rate':>9} {'target':>8} "
+                 f"{'backlog':>8} {'last V':>11}  file / error"]
+        for row in self.latest.values():
+            rate = row.get('rate')
+            last = row.get('last')
+            lines.append(
+                f"{row['rig']:<16} {row['state']:<10} {row.get('elapsed', 0.0):>8.1f}s {row.get('samples', 0):>10} "
+                f"{'-' if rate is None else f'{rate:.2f}':>9} {row['target']:>8g} {row.get('backlog', 0):>8} "
+                f"{'-' if last is None else f'{last:.7g}':>11}  {row.get('file') or row.get('error') or ''}"
+                + (f" ({row['reconnects']} reconnects)" if row.get('reconnects') else ''))
+        return '\n'.join(lines)
+
+    def show(self):
+        if sys.stdout.isatty():
+            print('\033[H\033[J', end='')  # Redraw in place
+        print(self.table(), flush=True)
+        if not sys.stdout.isatty():
+            print(flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several AgilentDMM rigs in parallel, one process each.")
+    parser.add_argument('configs', nargs='+', help="One config.yaml per rig.")
+    parser.add_argument('--output-root', type=str, default='runs', help="Each rig's files go in <root>/<rig name>/.")
+    parser.add_argument('--status-interval', type=float, default=1.0, help="Seconds between status updates.")
+    args = parser.parse_args()
+
+    runner = BatchRunner(rig_configs(args.configs, args.output_root), args.status_interval)
+    signal.signal(signal.SIGINT, runner.stop)
+    signal.signal(signal.SIGTERM, runner.stop)
+    if sys.stdin is not None and sys.stdin.isatty():
+        def wait_for_user_input():
+            input("Press Enter to stop all rigs...\n")
+            runner.stop()
+
+        threading.Thread(target=wait_for_user_input, daemon=True).start()
+
+    results = runner.run()
+    sys.exit(1 if any(row['state'] == 'failed' for row in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+
+class SampleBuffer:
+    """Columnar store of (monotonic time, voltage) samples in preallocated float64 chunks.
+
+    Samples are stamped with `time.monotonic()` on the hot path. One anchor pair,
+    taken when the buffer is created unless one is passed in, maps monotonic
+    time back to wall-clock epoch seconds, so timestamps are only turned into
+    text when exported.
+
+    Indices are global sample numbers for the whole session. Only the newest
+    `max_chunks` chunks are kept in memory; older samples are expected to be on
+    disk already.
+    """
+
+    def __init__(self, chunk_size=65536, max_chunks=16, anchor=None):
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        # Buffers that share an anchor share one time base
+        self.wall_anchor, self.mono_anchor = anchor or (time.time(), time.monotonic())
+        self.chunks = []  # [times, voltages] pairs of shape (chunk_size,)
+        self.first_index = 0  # Global index of the first sample still in memory
+        self.count = 0  # Total samples appended over the session
+
+    def __len__(self):
+        return self.count
+
+    def _chunk_for(self, index):
+        chunk, offset = divmod(index - self.first_index, self.chunk_size)
+        return self.chunks[chunk], offset
+
+    def _grow(self):
+        self.chunks.append((np.empty(self.chunk_size), np.empty(self.chunk_size)))
+        if self.max_chunks and len(self.chunks) > self.max_chunks:
+            self.chunks.pop(0)
+            self.first_index += self.chunk_size
+
+    def append(self, t, volts):
+        if (self.count - self.first_index) % self.chunk_size == 0:
+            self._grow()
+        (times, voltages), offset = self._chunk_for(self.count)
+        times[offset] = t
+        voltages[offset] = volts
+        self.count += 1
+
+    def extend(self, times, voltages):
+        """Append a block; returns the global index range it occupies."""
+        times = np.asarray(times, dtype=np.float64)
+        voltages = np.asarray(voltages, dtype=np.float64)
+        start = self.count
+        done = 0
+        while done < len(times):
+            if (self.count - self.first_index) % self.chunk_size == 0:
+                self._grow()
+            (chunk_times, chunk_voltages), offset = self._chunk_for(self.count)
+            n = min(len(times) - done, self.chunk_size - offset)
+            chunk_times[offset:offset + n] = times[done:done + n]
+            chunk_voltages[offset:offset + n] = voltages[done:done + n]
+            done += n
+            self.count += n
+        return start, self.count
+
+    def segments(self, start=None, stop=None):
+        """Yield zero-copy (times, voltages) views covering [start, stop), one per chunk."""
+        start = self.first_index if start is None else max(start, self.first_index)
+        stop = self.count if stop is None else min(stop, self.count)
+        while start < stop:
+            (times, voltages), offset = self._chunk_for(start)
+            n = min(stop - start, self.chunk_size - offset)
+            yield times[offset:offset + n], voltages[offset:offset + n]
+            start += n
+
+    def view(self, start=None, stop=None):
+        """(times, voltages) for [start, stop); zero-copy unless the range spans chunks."""
+        parts = list(self.segments(start, stop))
+        if not parts:
+            return np.empty(0), np.empty(0)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("SampleBuffer only supports contiguous slices")
+        start, stop, _ = key.indices(self.count)
+        return self.view(start, stop)
+
+    def to_wall(self, times):
+        """Convert monotonic sample times to epoch seconds."""
+        return self.wall_anchor + (np.asarray(times) - self.mono_anchor)
+
+    def format_timestamps(self, times):
+        """Local-time 'YYYY-mm-dd HH:MM:SS.ffffff' strings, built only at export time."""
+        wall = self.to_wall(times)
+        if len(wall) == 0:
+            return np.empty(0, dtype=str)
+        utc_offset = datetime.fromtimestamp(wall[0], timezone.utc).astimezone().utcoffset().total_seconds()
+        local_us = np.round((wall + utc_offset) * 1e6).astype(np.int64).astype('datetime64[us]')
+        return np.char.replace(np.datetime_as_string(local_us, unit='us'), 'T', ' ')
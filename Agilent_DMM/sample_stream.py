@@ -0,0 +1,207 @@
+"""
+Live sample stream over TCP for other tools in the lab.
+
+SamplePublisher listens on a TCP port and sends every subscriber batched
+binary frames:
+
+    magic    4 bytes   b'DMMS'
+    count    uint32    n, samples in this frame
+    sequence uint64    index of the first sample in the session
+    times    n x float64 epoch seconds
+    voltages n x float64 volts
+
+all little-endian. A gap in `sequence` means samples were dropped before
+they reached the socket. The acquisition thread only hands blocks to a
+bounded queue; one publisher thread batches them every `interval` seconds
+and writes to non-blocking sockets. A subscriber that lets more than
+`max_pending` bytes pile up is disconnected rather than slowing anyone else.
+
+Subscribe from the command line (or use SampleSubscriber):
+    python sample_stream.py --host 127.0.0.1 --port 5555
+"""
+
+import time
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import numpy as np
+
+HEADER = struct.Struct('<4sIQ')
+MAGIC = b'DMMS'
+
+
+class SamplePublisher:
+    def __init__(self, samples, host='127.0.0.1', port=5555, interval=0.05, max_pending=1 << 22, queue_size=1000):
+        self.samples = samples  # SampleBuffer, for its time anchor
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.max_pending = max_pending
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.subscribers = []  # [socket, pending bytes, address]
+        self.dropped_blocks = 0
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        self.server.setblocking(False)
+        self.port = self.server.getsockname()[1]  # Resolved if 0 was asked for
+        self.thread = threading.Thread(target=self._run, name='publisher', daemon=True)
+        self.thread.start()
+        logging.info(f"Streaming samples on {self.host}:{self.port}")
+
+    def publish(self, index, times, voltages):
+        """Queue a block starting at sample `index` for the subscribers; never blocks the caller."""
+        try:
+            self.queue.put_nowait((index, times, voltages))
+        except queue.Full:
+            self.dropped_blocks += 1
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        for subscriber in self.subscribers:
+            subscriber[0].close()
+        self.subscribers = []
+        self.server.close()
+        if self.dropped_blocks:
+            logging.warning(f"Sample stream dropped {self.dropped_blocks} blocks.")
+
+    def _run(self):
+        blocks = []
+        next_send = time.monotonic() + self.interval
+        running = True
+        while running:
+            try:
+                block = self.queue.get(timeout=max(0.0, next_send - time.monotonic()))
+                if block is None:
+                    running = False
+                else:
+                    blocks.append(block)
+                    if time.monotonic() < next_send:
+                        continue
+            except queue.Empty:
+                pass
+            next_send = time.monotonic() + self.interval
+            self._accept()
+            for run in self._contiguous(blocks):
+                self._broadcast(self._frame(run))
+            blocks = []
+            self._send()
+
+    @staticmethod
+    def _contiguous(blocks):
+        """Split queued blocks into runs without gaps, so a dropped block shows up as a sequence gap."""
+        run = []
+        for block in blocks:
+            if run and block[0] != run[-1][0] + len(run[-1][2]):
+                yield run
+                run = []
+            run.append(block)
+        if run:
+            yield run
+
+    def _frame(self, blocks):
+        times = self.samples.to_wall(np.concatenate([block[1] for block in blocks]))
+        voltages = np.concatenate([block[2] for block in blocks])
+        return (HEADER.pack(MAGIC, len(voltages), blocks[0][0]) + times.astype('<f8').tobytes()
+                + voltages.astype('<f8').tobytes())
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            connection.setblocking(False)
+            self.subscribers.append([connection, bytearray(), address])
+            logging.info(f"Stream subscriber connected from {address}")
+
+    def _broadcast(self, frame):
+        for subscriber in self.subscribers:
+            subscriber[1] += frame
+
+    def _send(self):
+        keep = []
+        for subscriber in self.subscribers:
+            connection, pending, address = subscriber
+            try:
+                while pending:
+                    sent = connection.send(pending)
+                    del pending[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                logging.info(f"Stream subscriber {address} disconnected")
+                connection.close()
+                continue
+            if len(pending) > self.max_pending:
+                logging.warning(f"Dropping slow stream subscriber {address}")
+                connection.close()
+                continue
+            keep.append(subscriber)
+        self.subscribers = keep
+
+
+class SampleSubscriber:
+    """Blocking reader of a SamplePublisher stream."""
+
+    def __init__(self, host='127.0.0.1', port=5555, timeout=None):
+        self.connection = socket.create_connection((host, port), timeout=timeout)
+        self.stream = self.connection.makefile('rb')
+
+    def read_frame(self):
+        """(sequence, epoch times, voltages) of the next frame; None once the publisher has gone."""
+        header = self.stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        magic, count, sequence = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"Not a sample stream frame: {magic!r}")
+        payload = self.stream.read(16 * count)
+        if len(payload) < 16 * count:
+            return None
+        values = np.frombuffer(payload, dtype='<f8')
+        return sequence, values[:count], values[count:]
+
+    def __iter__(self):
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print frames from a running AgilentDMM sample stream.")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    args = parser.parse_args()
+
+    subscriber = SampleSubscriber(args.host, args.port)
+    expected = None
+    try:
+        for sequence, times, voltages in subscriber:
+            if expected is not None and sequence != expected:
+                print(f"Gap: {sequence - expected} samples missing")
+            expected = sequence + len(voltages)
+            print(f"#{sequence}: {len(voltages)} samples, last {voltages[-1]:.7g} V at {times[-1]:.6f}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        subscriber.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+
+
+class DeadlineScheduler:
+    """Paces a loop on absolute monotonic deadlines and records how late each tick was.
+
+    Deadlines are `start + k * period`, so time spent in the loop body never
+    accumulates as drift. When the body overruns by more than a period the
+    `overrun` policy decides what happens to the missed ticks:
+
+    - 'skip': drop them and resume on the next future deadline.
+    - 'catch_up': run them back to back until the schedule is met again.
+    """
+
+    def __init__(self, frequency, overrun='skip', history=1 << 16):
+        if overrun not in ('skip', 'catch_up'):
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        self.period = 1 / frequency
+        self.overrun = overrun
+        self.lateness = np.zeros(history)  # Ring of the most recent tick lateness values, seconds
+        self.ticks = 0
+        self.skipped = 0
+        self.start_time = None
+        self.next_deadline = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.next_deadline = self.start_time
+
+    def wait(self, stop_flag=None):
+        """Sleep until the next deadline. Returns False if stop_flag was set while waiting."""
+        self.next_deadline += self.period
+        now = time.monotonic()
+        if self.overrun == 'skip' and now > self.next_deadline + self.period:
+            missed = int((now - self.next_deadline) // self.period)
+            self.next_deadline += missed * self.period
+            self.skipped += missed
+
+        delay = self.next_deadline - now
+        if delay > 0:
+            if stop_flag is not None:
+                if stop_flag.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+        self.lateness[self.ticks % len(self.lateness)] = time.monotonic() - self.next_deadline
+        self.ticks += 1
+        return True
+
+    def report(self):
+        """Achieved tick rate and lateness percentiles (ms) for the run so far."""
+        elapsed = time.monotonic() - self.start_time
+        lateness = self.lateness[:min(self.ticks, len(self.lateness))] * 1e3
+        p50, p95, p99 = np.percentile(lateness, [50, 95, 99]) if len(lateness) else (0.0, 0.0, 0.0)
+        return {
+            'target_rate': 1 / self.period,
+            'achieved_rate': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'lateness_p50_ms': p50,
+            'lateness_p95_ms': p95,
+            'lateness_p99_ms': p99,
+            'lateness_max_ms': lateness.max() if len(lateness) else 0.0,
+        }
@@ -0,0 +1,304 @@
+"""
+Segmented sessions: a directory of rotating segment files plus a manifest.
+
+Layout:
+    PDMS_Test_<start time>/
+        manifest.json          session id, extension, metadata, status and one
+                               entry per segment (file, first row, rows,
+                               first/last epoch time, complete)
+        segment_0000.csv       (or .h5, .dmmz) rotated every segment_interval seconds
+        segment_0001.csv
+
+The manifest is replaced atomically after every fsync'd flush, so after a
+crash it describes at most one flush interval less than is on disk. A
+session whose manifest still says 'recording' was not closed cleanly;
+`find_incomplete` finds it and `reconcile` trims the partial tail of its
+last segment and brings the manifest in line with the files, so recording
+can resume into the same session.
+
+`apply_retention` ages a long-running session out: old segments are
+replaced by segment_NNNN_<period>s files of bin means and later deleted,
+with their manifest entries updated or dropped first. It is split into
+`plan_retention`, which writes the downsampled files, and
+`commit_retention`, which updates the manifest and deletes files, so a
+recorder can do the slow half on another thread. `apply_retention_all`
+does the same for every other session in the output directory, so the
+sessions of earlier runs age out too.
+"""
+
+import os
+import re
+import json
+import logging
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def segment_name(number, extension):
+    return f'segment_{number:04d}{extension}'
+
+
+def write_manifest(directory, manifest):
+    """Atomically replace the manifest."""
+    path = os.path.join(directory, MANIFEST)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), 'r') as f:
+        return json.load(f)
+
+
+def find_incomplete(output_dir, prefix='PDMS_Test_'):
+    """Directory of the most recent session that was never closed, or None."""
+    if not os.path.isdir(output_dir):
+        return None
+    for name in sorted(os.listdir(output_dir), reverse=True):
+        directory = os.path.join(output_dir, name)
+        if name.startswith(prefix) and os.path.isfile(os.path.join(directory, MANIFEST)):
+            try:
+                if read_manifest(directory).get('status') == 'recording':
+                    return directory
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unreadable manifest in {directory}: {e}")
+    return None
+
+
+def _reconcile_csv(path):
+    """Cut a half-written last row; returns (rows, last epoch time or None)."""
+    size = os.path.getsize(path)
+    with open(path, 'rb+') as f:
+        tail_start = max(0, size - 65536)
+        f.seek(tail_start)
+        tail = f.read()
+        cut = tail.rfind(b'\n')
+        if cut < 0 and tail_start == 0:
+            # Not even the header made it to disk
+            f.seek(0)
+            f.truncate()
+            f.write(b'timestamp,voltage\n')
+            return 0, None
+        if tail_start + cut + 1 < size:
+            f.truncate(tail_start + cut + 1)
+        f.seek(0)
+        rows = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1
+    if rows <= 0:
+        return 0, None
+    from session_file import parse_timestamps
+
+    last_row = tail[:cut].rsplit(b'\n', 1)[-1]
+    return rows, float(parse_timestamps([last_row.split(b',')[0].decode()])[0])
+
+
+def _reconcile_hdf5(path):
+    import h5py
+
+    try:
+        with h5py.File(path, 'r+') as f:
+            rows = min(f['time'].shape[0], f['voltage'].shape[0])
+            for name in ('time', 'voltage'):
+                f[name].resize((rows,))
+            return rows, (float(f['time'][rows - 1]) if rows else None)
+    except Exception as e:
+        # A crash mid-write can leave the HDF5 metadata unreadable; keep the file for forensics
+        logging.error(f"Segment {path} is unreadable ({e}); moved aside.")
+        os.replace(path, path + '.corrupt')
+        return 0, None
+
+
+def reconcile(directory, manifest):
+    """Bring the manifest's incomplete segments in line with what reached the disk."""
+    for segment in manifest['segments']:
+        if segment['complete']:
+            continue
+        path = os.path.join(directory, segment['file'])
+        if not os.path.exists(path):
+            rows, last_time = 0, None
+        elif path.endswith('.csv'):
+            rows, last_time = _reconcile_csv(path)
+        elif path.endswith('.dmmz'):
+            from compact_file import repair
+
+            rows, last_time = repair(path)
+        else:
+            rows, last_time = _reconcile_hdf5(path)
+        if rows != segment['rows']:
+            logging.info(f"Reconciled {segment['file']}: manifest had {segment['rows']} rows, disk has {rows}.")
+        segment['rows'] = rows
+        if last_time is not None:
+            segment['end_time'] = last_time
+        segment['complete'] = True
+    write_manifest(directory, manifest)
+    return manifest
+
+
+def read_segments(directory):
+    """The whole session as (epoch times, voltages), across every segment in order."""
+    manifest = read_manifest(directory)
+    times, voltages = [], []
+    for segment in manifest['segments']:
+        path = os.path.join(directory, segment['file'])
+        if not segment['rows'] or not os.path.exists(path):
+            continue
+        if path.endswith('.csv'):
+            import pandas as pd
+            from session_file import parse_timestamps
+
+            frame = pd.read_csv(path, dtype={'timestamp': str, 'voltage': float}, nrows=segment['rows'])
+            times.append(parse_timestamps(frame['timestamp'].to_numpy()))
+            voltages.append(frame['voltage'].to_numpy())
+        elif path.endswith('.dmmz'):
+            from compact_file import read_compact
+
+            segment_times, segment_voltages = read_compact(path)
+            times.append(segment_times[:segment['rows']])
+            voltages.append(segment_voltages[:segment['rows']])
+        else:
+            from session_file import read_session
+
+            segment_times, segment_voltages = read_session(path)
+            times.append(segment_times[:segment['rows']])
+            voltages.append(segment_voltages[:segment['rows']])
+    if not times:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(times), np.concatenate(voltages)
+
+
+def downsample_segment(directory, segment, segment_class, metadata, period):
+    """Replace a complete segment's file with `period`-second bin means, written by segment_class."""
+    from analysis import iter_chunks, Resampler
+    from sample_buffer import SampleBuffer
+
+    path = os.path.join(directory, segment['file'])
+    resampler = Resampler(period)
+    # Rows past the manifest's count were never committed
+    for times, voltages in iter_chunks(path, rows=segment['rows']):
+        if len(times):
+            resampler.update(times, voltages)
+    series = resampler.series(period)
+    stem, extension = os.path.splitext(segment['file'])
+    name = f'{stem}_{period:g}s{extension}'
+    # Epoch anchor: the writer's monotonic times are already wall times
+    writer = segment_class(os.path.join(directory, name), SampleBuffer(anchor=(0.0, 0.0)),
+                           metadata=dict(metadata, measurement_frequency=1.0 / period, downsampled=period))
+    writer._open()
+    if len(series['time']):
+        writer._write_rows(series['time'], series['mean'])
+    writer._flush()
+    writer._close_file()
+    segment.update(file=name, full_rows=segment.get('full_rows', segment['rows']), rows=len(series['time']),
+                   downsampled=period)
+    return path
+
+
+def plan_retention(directory, segments, segment_class, metadata, full_age=None, downsampled_age=None,
+                   period=1.0, now=None):
+    """
+    The slow half of retention: write downsampled files for the complete
+    `segments` (manifest entries, updated in place) that are due. Returns
+    ({file: new entry, or None to drop it}, files to delete) for
+    `commit_retention`; the manifest itself is not touched.
+    """
+    import time
+
+    now = time.time() if now is None else now
+    updates = {}
+    removed = []
+    for segment in segments:
+        age = now - segment['end_time'] if segment['complete'] and segment['end_time'] is not None else None
+        if age is None:
+            continue
+        name = segment['file']
+        if not segment.get('downsampled') and full_age is not None and age > full_age:
+            if period:
+                removed.append(downsample_segment(directory, segment, segment_class, metadata, period))
+                updates[name] = segment
+                logging.info(f"Downsampled {name} to {period:g} s means.")
+            else:
+                removed.append(os.path.join(directory, name))
+                updates[name] = None
+        elif segment.get('downsampled') and downsampled_age is not None and age > downsampled_age:
+            removed.append(os.path.join(directory, name))
+            updates[name] = None
+    return updates, removed
+
+
+def commit_retention(directory, manifest, updates, removed):
+    """Point the manifest at the downsampled files, write it, then delete what it no longer names."""
+    segments = [updates.get(segment['file'], segment) for segment in manifest['segments']]
+    manifest['segments'] = [segment for segment in segments if segment is not None]
+    # The manifest stops pointing at a file before the file goes
+    write_manifest(directory, manifest)
+    for path in removed:
+        if os.path.exists(path):
+            os.remove(path)
+    # Event sidecars are named after the full-rate segment and go with its last file
+    numbers = {re.match(r'segment_\d+', segment['file']).group() for segment in manifest['segments']}
+    for name in os.listdir(directory):
+        match = re.match(r'(segment_\d+)\.events\.csv$', name)
+        if match and match.group(1) not in numbers:
+            os.remove(os.path.join(directory, name))
+    logging.info(f"Retention removed {len(removed)} full-rate or expired segment files from {directory}.")
+    return manifest
+
+
+def apply_retention(directory, manifest, segment_class, full_age=None, downsampled_age=None, period=1.0, now=None):
+    """
+    Age out complete segments: after `full_age` seconds a segment is replaced
+    by its `period`-second means (or deleted if period is 0), and after
+    `downsampled_age` seconds the downsampled file is deleted too. Ages are
+    measured from a segment's last sample; None keeps that stage forever.
+    """
+    updates, removed = plan_retention(directory, manifest['segments'], segment_class, manifest['metadata'],
+                                      full_age, downsampled_age, period, now)
+    if not removed:
+        return manifest
+    return commit_retention(directory, manifest, updates, removed)
+
+
+def apply_retention_all(output_dir, current=None, prefix='PDMS_Test_', full_age=None, downsampled_age=None,
+                        period=1.0, now=None):
+    """
+    apply_retention for every segmented session in output_dir except `current`.
+
+    A session still marked 'recording' whose newest sample is older than the
+    shortest retention age was abandoned by a crash or restart. It is
+    reconciled and marked complete, so it ages out like the rest. A session
+    left without segments is removed.
+    """
+    import time
+    from recorder import RECORDERS
+
+    now = time.time() if now is None else now
+    ages = [age for age in (full_age, downsampled_age) if age is not None]
+    if not ages or not os.path.isdir(output_dir):
+        return
+    for name in sorted(os.listdir(output_dir)):
+        directory = os.path.join(output_dir, name)
+        if (not name.startswith(prefix) or os.path.abspath(directory) == os.path.abspath(current or '')
+                or not os.path.isfile(os.path.join(directory, MANIFEST))):
+            continue
+        try:
+            manifest = read_manifest(directory)
+            if manifest.get('status') == 'recording':
+                ends = [segment['end_time'] for segment in manifest['segments'] if segment['end_time'] is not None]
+                if not ends or now - max(ends) <= min(ages):
+                    continue  # Possibly still being written
+                manifest = reconcile(directory, manifest)
+                manifest['status'] = 'complete'
+                write_manifest(directory, manifest)
+                logging.info(f"Closed abandoned session {directory} for retention.")
+            segment_class = next(cls for cls, extension in RECORDERS.values() if extension == manifest['extension'])
+            manifest = apply_retention(directory, manifest, segment_class, full_age, downsampled_age, period, now)
+            if not manifest['segments']:
+                os.remove(os.path.join(directory, MANIFEST))
+                os.rmdir(directory)
+                logging.info(f"Removed expired session {directory}.")
+        except (OSError, ValueError, KeyError, StopIteration) as e:
+            logging.warning(f"Retention skipped {directory}: {e}")
@@ -0,0 +1,159 @@
+"""
+HDF5 session files for AgilentDMM recordings.
+
+Layout:
+    /            attrs: format version, start time, instrument identity and
+                 the measurement settings from config.yaml
+    /time        float64 epoch seconds, chunked and resizable
+    /voltage     float64 volts, chunked and resizable
+    /index       (epoch seconds, row) pairs, one every `index_interval`
+                 seconds, so a time window can be read without scanning
+                 the whole file
+    /events      (time, kind, value) records from the online statistics,
+                 e.g. when the signal settled; created on the first event
+
+Usage:
+    python session_file.py convert PDMS_Test_2024-06-26_20-43-27.csv
+"""
+
+import argparse
+import logging
+from datetime import datetime
+import numpy as np
+import h5py
+
+FORMAT_NAME = 'agilent-dmm-session'
+FORMAT_VERSION = 1
+
+
+def create_session(filename, metadata, chunk_rows=16384):
+    """Create an empty session file and return the open h5py.File."""
+    f = h5py.File(filename, 'w')
+    f.attrs['format'] = FORMAT_NAME
+    f.attrs['version'] = FORMAT_VERSION
+    for key, value in metadata.items():
+        f.attrs[key] = '' if value is None else value
+    for name in ('time', 'voltage'):
+        f.create_dataset(name, shape=(0,), maxshape=(None,), dtype='f8', chunks=(chunk_rows,),
+                         compression='gzip', shuffle=True)
+    f.create_dataset('index', shape=(0, 2), maxshape=(None, 2), dtype='f8', chunks=(1024, 2))
+    return f
+
+
+def append_samples(f, times, voltages, index_interval=60.0):
+    """Append epoch times and voltages, adding index entries every index_interval seconds."""
+    n = len(times)
+    if n == 0:
+        return
+    row = f['time'].shape[0]
+    for name, values in (('time', times), ('voltage', voltages)):
+        f[name].resize((row + n,))
+        f[name][row:] = values
+
+    index = f['index']
+    next_entry = index[-1, 0] + index_interval if index.shape[0] else times[0]
+    entries = []
+    while next_entry <= times[-1]:
+        offset = int(np.searchsorted(times, next_entry))
+        entries.append((times[offset], row + offset))
+        next_entry = times[offset] + index_interval
+    if entries:
+        index.resize((index.shape[0] + len(entries), 2))
+        index[-len(entries):] = entries
+
+
+EVENT_DTYPE = np.dtype([('time', 'f8'), ('kind', 'S16'), ('value', 'f8')])
+
+
+def append_events(f, times, kinds, values):
+    """Append (epoch time, kind, value) event records."""
+    if 'events' not in f:
+        f.create_dataset('events', shape=(0,), maxshape=(None,), dtype=EVENT_DTYPE, chunks=(256,))
+    records = np.array(list(zip(times, [kind.encode() for kind in kinds], values)), dtype=EVENT_DTYPE)
+    events = f['events']
+    events.resize((events.shape[0] + len(records),))
+    events[-len(records):] = records
+
+
+def read_events(filename):
+    """List of (epoch time, kind, value) events in a session file."""
+    with h5py.File(filename, 'r') as f:
+        if 'events' not in f:
+            return []
+        return [(float(t), kind.decode(), float(v)) for t, kind, v in f['events'][:]]
+
+
+def read_session(filename, start=None, stop=None):
+    """
+    Load (times, voltages) for the epoch window [start, stop).
+
+    Only the rows between the surrounding index entries are read from disk.
+    """
+    with h5py.File(filename, 'r') as f:
+        total = f['time'].shape[0]
+        index = f['index'][:]
+        first, last = 0, total
+        if len(index):
+            if start is not None:
+                entry = np.searchsorted(index[:, 0], start, side='right') - 1
+                first = int(index[entry, 1]) if entry >= 0 else 0
+            if stop is not None:
+                entry = np.searchsorted(index[:, 0], stop, side='left')
+                last = int(index[entry, 1]) if entry < len(index) else total
+        times = f['time'][first:last]
+        voltages = f['voltage'][first:last]
+
+    mask = np.ones(len(times), dtype=bool)
+    if start is not None:
+        mask &= times >= start
+    if stop is not None:
+        mask &= times < stop
+    return times[mask], voltages[mask]
+
+
+def read_metadata(filename):
+    with h5py.File(filename, 'r') as f:
+        return dict(f.attrs)
+
+
+def parse_timestamps(timestamps):
+    """Vectorized parse of local 'YYYY-mm-dd HH:MM:SS.ffffff' strings to epoch seconds."""
+    local = np.asarray(timestamps, dtype='datetime64[us]')
+    if len(local) == 0:
+        return np.empty(0)
+    local_seconds = local.astype(np.int64) / 1e6
+    # Naive local time; recover the UTC offset from the first row
+    first = datetime.fromisoformat(str(local[0]))
+    utc_offset = first.astimezone().utcoffset().total_seconds()
+    return local_seconds - utc_offset
+
+
+def convert_csv(csv_filename, h5_filename=None, chunk_rows=16384, index_interval=60.0):
+    """Convert a PDMS_Test_*.csv recording into a session file."""
+    import pandas as pd
+
+    h5_filename = h5_filename or csv_filename.rsplit('.', 1)[0] + '.h5'
+    metadata = {'source': csv_filename}
+    with create_session(h5_filename, metadata, chunk_rows) as f:
+        for chunk in pd.read_csv(csv_filename, chunksize=chunk_rows, dtype={'timestamp': str, 'voltage': float}):
+            times = parse_timestamps(chunk['timestamp'].to_numpy())
+            append_samples(f, times, chunk['voltage'].to_numpy(), index_interval)
+        if f['time'].shape[0]:
+            f.attrs['start_time'] = datetime.fromtimestamp(f['time'][0]).isoformat()
+    logging.info(f"Converted {csv_filename} to {h5_filename}")
+    return h5_filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert PDMS_Test CSV recordings to HDF5 session files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help="Convert one or more CSV files.")
+    convert.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    for csv_filename in args.csv_files:
+        print(f"{csv_filename} -> {convert_csv(csv_filename)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Shared-memory ring of (monotonic time, voltage) samples for out-of-process viewers.
+
+One writer (the acquisition process) and any number of readers. The block
+starts with an int64 header (version, capacity, sequence, closed), the
+float64 session anchors and an int64 `claimed`, followed by the time and
+voltage rings. Before touching any slot the writer raises `claimed` to the
+end of the block it is about to write; it fills the slots and only then
+advances `sequence`, the total number of samples ever published. Readers
+copy the published slots they haven't seen yet and read `claimed`
+afterwards. Any slot within `capacity` of it may have been overwritten
+while they were copying, even by a write still in progress, and is
+discarded. The writer never waits for a reader, so a stalled viewer can
+only lose data, never slow acquisition.
+"""
+
+import os
+import numpy as np
+from multiprocessing import shared_memory
+
+VERSION = 2
+HEADER_BYTES = 64  # int64 version, capacity, sequence, closed; float64 wall_anchor, mono_anchor; int64 claimed
+
+
+class SharedRing:
+    def __init__(self, name, capacity=None, create=False):
+        self.name = name
+        if create:
+            size = HEADER_BYTES + 16 * capacity
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Left behind by a writer that crashed; nobody else can own a ring with our name
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == 'posix':
+                # Python < 3.13 would otherwise unlink the writer's segment when this reader exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.header = np.ndarray(4, dtype=np.int64, buffer=self.shm.buf)
+        self.anchors = np.ndarray(2, dtype=np.float64, buffer=self.shm.buf, offset=32)
+        self.claimed = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf, offset=48)
+        if create:
+            self.header[:] = (VERSION, capacity, 0, 0)
+            self.claimed[0] = 0
+        elif self.header[0] != VERSION:
+            raise ValueError(f"Shared ring {name} has version {self.header[0]}, expected {VERSION}")
+        self.capacity = int(self.header[1])
+        self.times = np.ndarray(self.capacity, dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.voltages = np.ndarray(self.capacity, dtype=np.float64, buffer=self.shm.buf,
+                                   offset=HEADER_BYTES + 8 * self.capacity)
+        self.owner = create
+        # Readers start with as much history as the ring still holds
+        self.position = 0 if create else max(0, int(self.header[2]) - self.capacity)
+
+    @classmethod
+    def create(cls, name, capacity, anchor):
+        """Create the ring for a session; anchor is the (wall, monotonic) pair of its SampleBuffer."""
+        ring = cls(name, capacity, create=True)
+        ring.anchors[:] = anchor
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name)
+
+    @property
+    def sequence(self):
+        return int(self.header[2])
+
+    @property
+    def closed(self):
+        return bool(self.header[3])
+
+    def write(self, times, voltages):
+        """Copy a block into the ring and publish it by advancing the sequence."""
+        n = len(voltages)
+        if n == 0:
+            return
+        if n > self.capacity:
+            times, voltages = times[-self.capacity:], voltages[-self.capacity:]
+        sequence = int(self.header[2]) + n - len(voltages)
+        self.claimed[0] = sequence + len(voltages)  # Readers must not trust the slots this will overwrite
+        head = sequence % self.capacity
+        first = min(len(voltages), self.capacity - head)
+        self.times[head:head + first] = times[:first]
+        self.voltages[head:head + first] = voltages[:first]
+        self.times[:len(voltages) - first] = times[first:]
+        self.voltages[:len(voltages) - first] = voltages[first:]
+        self.header[2] = sequence + len(voltages)
+
+    def read(self):
+        """
+        (times, voltages) written since the last read, as copies. Returns the
+        number of samples lost to overruns as a third element.
+        """
+        sequence = int(self.header[2])
+        start = max(self.position, sequence - self.capacity)
+        lost = start - self.position
+        indices = np.arange(start, sequence) % self.capacity
+        times = self.times[indices]
+        voltages = self.voltages[indices]
+        # Anything the writer overwrote, or started overwriting, while we were copying is unreliable
+        valid_from = int(self.claimed[0]) - self.capacity
+        if valid_from > start:
+            cut = valid_from - start
+            times, voltages = times[cut:], voltages[cut:]
+            lost += cut
+        self.position = sequence
+        return times, voltages, lost
+
+    def close(self):
+        """Detach; the writer also marks the ring closed and removes it."""
+        if self.owner:
+            self.header[3] = 1
+        self.header = self.anchors = self.claimed = self.times = self.voltages = None  # Release the buffer exports
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
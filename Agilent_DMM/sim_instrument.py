@@ -0,0 +1,214 @@
+import time
+import threading
+from types import SimpleNamespace
+import numpy as np
+from dmm_models import resolution_table
+
+NPLC_RESOLUTION = resolution_table('34461A')
+
+
+class SimParameter:
+    """Minimal stand-in for a qcodes Parameter: call to get, call with a value or .set() to set."""
+
+    def __init__(self, value=None, get_cmd=None):
+        self.value = value
+        self.get_cmd = get_cmd
+
+    def __call__(self, *args):
+        if args:
+            self.set(args[0])
+            return None
+        return self.get()
+
+    def get(self):
+        if self.get_cmd is not None:
+            return self.get_cmd()
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class SimulatedKeysight34461A:
+    """
+    Software model of the Keysight 34461A exposing the subset of the qcodes
+    driver that AgilentDMM uses, so the acquisition path can run without the
+    instrument.
+
+    Every query costs `latency` seconds (the VISA round trip) plus the
+    integration time NPLC / line_frequency. Readings are `level` plus Gaussian
+    noise whose standard deviation is `noise` at NPLC 1 and grows as
+    1/sqrt(NPLC), quantized to the resolution. As on the instrument, setting
+    NPLC (or the range) sets the resolution, setting the resolution picks
+    the NPLC that achieves it, and unsupported NPLC values are rounded up.
+    Timer-paced bursts
+    (SAMP:SOUR TIM / INIT / DATA:POIN? / R?) fill a simulated reading memory.
+    """
+
+    line_frequency = 60
+    settings = {}  # Per-address settings, which like the real instrument survive reconnects
+
+    def __init__(self, name, address, latency=0.002, noise=2e-6, level=5.039, seed=None):
+        self.name = name
+        self.address = address
+        self.latency = latency
+        self.noise = noise
+        self.level = level
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+        settings = self.settings.setdefault(address, {
+            'VOLT:DC:RANG': SimParameter(10.0),
+            'VOLT:DC:NPLC': SimParameter(10.0),
+            'VOLT:DC:ZERO:AUTO': SimParameter('ON'),
+            'VOLT:DC:RES': SimParameter(3e-6),
+            'TRIG:SOUR': SimParameter('IMM'),
+            'TRIG:DEL': SimParameter(0.0),
+            'TRIG:COUN': SimParameter(1),
+            'SAMP:COUN': SimParameter(1),
+            'SAMP:TIM': SimParameter(0.001),
+            'SAMP:SOUR': SimParameter('IMM'),
+            'FORM:DATA': SimParameter('ASC'),
+            'DISP': SimParameter(True),
+        })
+        self.scpi = settings
+        self.trigger = SimpleNamespace(source=settings['TRIG:SOUR'], delay=settings['TRIG:DEL'],
+                                       count=settings['TRIG:COUN'])
+        self.display = SimpleNamespace(enabled=settings['DISP'])
+        self.range = settings['VOLT:DC:RANG']
+        self.NPLC = settings['VOLT:DC:NPLC']
+        self.autozero = settings['VOLT:DC:ZERO:AUTO']
+        self.resolution = settings['VOLT:DC:RES']
+        self.volt = SimParameter(get_cmd=self._measure)
+        self.visa_handle = SimpleNamespace(query_binary_values=self._query_binary_values)
+
+        self.burst_start = None
+        self.burst_stop = None
+        self.burst_taken = 0
+
+    def IDN(self):
+        return {'vendor': 'Keysight Technologies', 'model': '34461A', 'serial': 'SIM00000', 'firmware': 'sim'}
+
+    def autorange_once(self):
+        self._transact()
+
+    def device_clear(self):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def measurement_time(self):
+        """Seconds per reading for the current integration settings."""
+        integration = float(self.NPLC()) / self.line_frequency
+        return integration * (2 if self.autozero() == 'ON' else 1)
+
+    def _noise_std(self):
+        return self.noise / np.sqrt(max(float(self.NPLC()), 1e-3))
+
+    def _readings(self, n):
+        values = self.level + self.rng.standard_normal(n) * self._noise_std()
+        resolution = float(self.resolution())
+        if resolution > 0:
+            values = np.round(values / resolution) * resolution
+        return values
+
+    def _transact(self, extra=0.0):
+        with self.lock:
+            time.sleep(self.latency + extra)
+
+    def _measure(self):
+        if self.scpi['FORM:DATA']() != 'ASC':
+            # A real READ? would answer with a binary block that float() can't parse
+            raise ValueError("could not convert a REAL,64 block to float")
+        self._transact(self.measurement_time)
+        return float(self._readings(1)[0])
+
+    def _available(self):
+        if self.burst_start is None:
+            return 0
+        now = self.burst_stop if self.burst_stop is not None else time.monotonic()
+        acquired = int((now - self.burst_start) / float(self.scpi['SAMP:TIM']())) + 1
+        return min(acquired, int(float(self.scpi['SAMP:COUN']()))) - self.burst_taken
+
+    def _take(self, n):
+        n = max(0, min(n, self._available()))
+        self.burst_taken += n
+        return self._readings(n)
+
+    def write(self, command):
+        self._transact()
+        for part in command.split(';'):
+            header, _, argument = part.strip().lstrip(':').partition(' ')
+            header = header.upper()
+            if header == 'FORM:DATA':
+                self.scpi[header].set('REAL' if argument.upper().startswith('REAL') else 'ASC')
+            elif header == 'SAMP:TIM':
+                self.scpi[header].set(max(float(argument), self.measurement_time))
+            elif header == 'DISP':
+                self.display.enabled.set(argument.upper() in ('ON', '1'))
+            elif header == 'VOLT:DC:ZERO:AUTO':
+                self.autozero.set('ON' if argument.upper() in ('ON', '1') else 'OFF')
+            elif header == 'VOLT:DC:RES':
+                fraction = float(argument) / float(self.range())
+                self.NPLC.set(min((nplc for nplc, finest in NPLC_RESOLUTION.items() if finest <= fraction * 1.001),
+                                  default=max(NPLC_RESOLUTION)))
+                self._couple_resolution()
+            elif header == 'VOLT:DC:NPLC':
+                # Unsupported values are rounded up to the next supported NPLC
+                self.NPLC.set(min((nplc for nplc in NPLC_RESOLUTION if nplc >= float(argument) * 0.999),
+                                  default=max(NPLC_RESOLUTION)))
+                self._couple_resolution()
+            elif header == 'VOLT:DC:RANG':
+                self.scpi[header].set(float(argument))
+                self._couple_resolution()
+            elif header in self.scpi:
+                self.scpi[header].set(argument.upper() if header in ('TRIG:SOUR', 'SAMP:SOUR') else float(argument))
+            elif header == 'INIT':
+                self.burst_start = time.monotonic()
+                self.burst_stop = None
+                self.burst_taken = 0
+            elif header == 'ABOR' and self.burst_start is not None:
+                self.burst_stop = time.monotonic()
+
+    def _couple_resolution(self):
+        nplc = max((nplc for nplc in NPLC_RESOLUTION if nplc <= float(self.NPLC()) * 1.001),
+                   default=min(NPLC_RESOLUTION))
+        self.resolution.set(float(self.range()) * NPLC_RESOLUTION[nplc])
+
+    def _query_setting(self, header):
+        value = self.scpi[header]()
+        if header == 'FORM:DATA':
+            return 'REAL,64' if value == 'REAL' else 'ASC,9'
+        if header in ('TRIG:SOUR', 'SAMP:SOUR'):
+            return str(value)
+        if header in ('DISP', 'VOLT:DC:ZERO:AUTO'):
+            return '1' if value in (True, 'ON') else '0'
+        return f'{float(value):+.8E}'
+
+    def ask(self, command):
+        header, _, argument = command.strip().partition(' ')
+        header = header.upper()
+        if all(part.strip().lstrip(':').upper()[:-1] in self.scpi for part in command.split(';')):
+            self._transact()
+            return ';'.join(self._query_setting(part.strip().lstrip(':').upper()[:-1])
+                            for part in command.split(';'))
+        if header == 'DATA:POIN?':
+            self._transact()
+            return str(self._available())
+        if header == 'R?':
+            readings = self._take(int(argument))
+            self._transact(len(readings) * 16e-7)  # ASCII transfer time
+            body = ','.join(f'{value:+.8E}' for value in readings)
+            return f'#{len(str(len(body)))}{len(body)}{body}'
+        if header == '*OPC?':
+            self._transact()
+            return '1'
+        raise ValueError(f"Simulated 34461A does not understand {command!r}")
+
+    def _query_binary_values(self, command, datatype='d', is_big_endian=True, container=list):
+        header, _, argument = command.strip().partition(' ')
+        readings = self._take(int(argument))
+        self._transact(len(readings) * 8e-7)  # Binary transfer time
+        return container(readings)
@@ -0,0 +1,149 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from compact_file import (CHUNK_HEADER, JOURNAL, CompactWriter, decode_chunk, encode_chunk, read_compact,
+                          repair)
+
+QUANTUM = 1e-6
+PERIOD_US = 100000  # 10 Hz
+TIME_TOLERANCE = 1e-6  # Microsecond rounding plus float64 resolution at epoch times
+
+
+def round_trip(times, voltages, quantum=QUANTUM, period_us=PERIOD_US):
+    chunk = encode_chunk(times, voltages, quantum, period_us)
+    header = CHUNK_HEADER.unpack_from(chunk)
+    assert len(chunk) == CHUNK_HEADER.size + header[6]
+    return decode_chunk(header, chunk[CHUNK_HEADER.size:], quantum, period_us)
+
+
+def samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    times = 1.7e9 + np.arange(n) * 0.1 + rng.normal(0, 2e-4, n)
+    voltages = np.round((1.5 + np.cumsum(rng.normal(0, 1e-4, n))) / QUANTUM) * QUANTUM
+    return times, voltages
+
+
+def test_round_trip():
+    times, voltages = samples(1000)
+    decoded_times, decoded_voltages = round_trip(times, voltages)
+    np.testing.assert_allclose(decoded_times, times, rtol=0, atol=TIME_TOLERANCE)
+    np.testing.assert_allclose(decoded_voltages, voltages, rtol=0, atol=QUANTUM / 2)
+
+
+def test_quantization_error_bounded():
+    times, _ = samples(500)
+    voltages = np.random.default_rng(1).uniform(-10, 10, 500)
+    _, decoded = round_trip(times, voltages, quantum=1e-4)
+    assert np.abs(decoded - voltages).max() <= 0.5e-4 + 1e-12
+
+
+def test_single_row():
+    times, voltages = round_trip(np.array([1.7e9 + 0.25]), np.array([-0.123456]))
+    assert len(times) == len(voltages) == 1
+    assert times[0] == pytest.approx(1.7e9 + 0.25, abs=TIME_TOLERANCE)
+    assert voltages[0] == pytest.approx(-0.123456, abs=QUANTUM / 2)
+
+
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf, 9.9e37, -9.9e37])
+def test_exceptions_kept_exactly(value):
+    times, voltages = samples(20)
+    voltages[[0, 7, 8, 19]] = value
+    _, decoded = round_trip(times, voltages)
+    np.testing.assert_array_equal(decoded[[0, 7, 8, 19]], voltages[[0, 7, 8, 19]])
+    normal = np.isfinite(voltages) & (np.abs(voltages) < 1e30)
+    np.testing.assert_allclose(decoded[normal], voltages[normal], rtol=0, atol=QUANTUM / 2)
+
+
+def test_single_row_exception():
+    _, decoded = round_trip(np.array([1.7e9]), np.array([np.nan]))
+    assert np.isnan(decoded[0])
+
+
+def test_irregular_times_widen_steps():
+    # A gap of an hour doesn't fit the one-byte jitter steps of a steady stream
+    times = 1.7e9 + np.r_[np.arange(5) * 0.1, 3600 + np.arange(5) * 0.1]
+    decoded, _ = round_trip(times, np.zeros(10))
+    np.testing.assert_allclose(decoded, times, rtol=0, atol=TIME_TOLERANCE)
+
+
+def test_writer_chunks_and_flushes(tmp_path):
+    filename = str(tmp_path / 'session.dmmz')
+    times, voltages = samples(1000)
+    writer = CompactWriter(filename, {'measurement_frequency': 10}, quantum=QUANTUM, chunk_rows=256)
+    for first in range(0, 1000, 7):
+        writer.write(times[first:first + 7], voltages[first:first + 7])
+        if first % 70 == 0:
+            writer.flush()
+    writer.close()
+    decoded_times, decoded_voltages = read_compact(filename)
+    np.testing.assert_allclose(decoded_times, times, rtol=0, atol=TIME_TOLERANCE)
+    np.testing.assert_allclose(decoded_voltages, voltages, rtol=0, atol=QUANTUM / 2)
+    assert writer.rows == 1000
+
+
+def test_repair_drops_torn_chunk(tmp_path):
+    filename = str(tmp_path / 'session.dmmz')
+    times, voltages = samples(600)
+    writer = CompactWriter(filename, {'measurement_frequency': 10}, quantum=QUANTUM, chunk_rows=256)
+    writer.write(times, voltages)
+    writer.close()
+    with open(filename, 'r+b') as f:
+        f.seek(-10, 2)
+        f.write(b'\xff' * 10)  # Corrupt the open last chunk
+    rows, _ = repair(filename)
+    assert rows == 512
+    np.testing.assert_allclose(read_compact(filename)[1], voltages[:512], rtol=0, atol=QUANTUM / 2)
+
+
+def crashed_writer(filename, times, voltages, chunk_rows, block=10):
+    """A writer that flushed every block and then lost power (file handles dropped, no close)."""
+    writer = CompactWriter(filename, {'measurement_frequency': 10}, quantum=QUANTUM, chunk_rows=chunk_rows)
+    for first in range(0, len(times), block):
+        writer.write(times[first:first + block], voltages[first:first + block])
+        writer.flush()
+    writer.file.close()
+    writer.journal.close()
+    return writer
+
+
+def test_torn_flush_keeps_earlier_flushes(tmp_path):
+    filename = str(tmp_path / 'session.dmmz')
+    times, voltages = samples(3000)
+    crashed_writer(filename, times, voltages, chunk_rows=4096)
+    with open(filename + JOURNAL, 'r+b') as f:
+        f.truncate(os.path.getsize(filename + JOURNAL) - 5)  # The last flush was cut short
+    rows, last_time = repair(filename)
+    assert rows == 2990
+    assert last_time == pytest.approx(times[2989], abs=TIME_TOLERANCE)
+    assert not os.path.exists(filename + JOURNAL)
+    np.testing.assert_allclose(read_compact(filename)[1], voltages[:2990], rtol=0, atol=QUANTUM / 2)
+
+
+def test_torn_seal_recovered_from_journal(tmp_path):
+    filename = str(tmp_path / 'session.dmmz')
+    times, voltages = samples(700)
+    crashed_writer(filename, times, voltages, chunk_rows=256)  # Two sealed chunks, 188 rows journaled
+    chunk = encode_chunk(times[512:], voltages[512:], QUANTUM, PERIOD_US)
+    with open(filename, 'ab') as f:
+        f.write(chunk[:len(chunk) // 2])  # Power cut while sealing the third chunk
+    rows, _ = repair(filename)
+    assert rows == 700
+    np.testing.assert_allclose(read_compact(filename)[1], voltages, rtol=0, atol=QUANTUM / 2)
+
+
+def test_journal_left_after_seal_not_duplicated(tmp_path):
+    filename = str(tmp_path / 'session.dmmz')
+    times, voltages = samples(300)
+    writer = CompactWriter(filename, {'measurement_frequency': 10}, quantum=QUANTUM, chunk_rows=256)
+    writer.write(times[:250], voltages[:250])
+    writer.flush()
+    shutil.copy(filename + JOURNAL, str(tmp_path / 'journal'))
+    writer.write(times[250:], voltages[250:])  # Seals 256 rows and empties the journal
+    writer.file.close()
+    writer.journal.close()
+    # Power cut after the sealed chunk was fsync'd, before the emptied journal reached the disk
+    shutil.copy(str(tmp_path / 'journal'), filename + JOURNAL)
+    rows, _ = repair(filename)
+    assert rows == 256
+    np.testing.assert_allclose(read_compact(filename)[0], times[:256], rtol=0, atol=TIME_TOLERANCE)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from decimation import MinMaxPyramid
+
+
+@pytest.fixture
+def pyramid():
+    # Small rings so 20000 samples spread over several wrapped levels
+    pyramid = MinMaxPyramid(factor=4, capacity=256)
+    rng = np.random.default_rng(0)
+    times = np.arange(20000) * 0.01
+    values = np.cumsum(rng.normal(0, 1, 20000))
+    for first in range(0, 20000, 333):
+        pyramid.extend(times[first:first + 333], values[first:first + 333])
+    return pyramid, times, values
+
+
+def test_levels_bounded(pyramid):
+    pyramid, _, _ = pyramid
+    assert len(pyramid) == 20000
+    assert len(pyramid.levels) > 3
+    assert all(len(level.times) == 256 for level in pyramid.levels)
+
+
+@pytest.mark.parametrize('start, stop', [(0, 200), (13.37, 150.5), (199.5, 199.9), (50, 50.005)])
+def test_window_within_bounds(pyramid, start, stop):
+    pyramid, _, _ = pyramid
+    times, values = pyramid.window(start, stop, max_points=200)
+    assert len(times) == len(values)
+    assert len(times) <= 200 + 2
+    if len(times):
+        assert times.min() >= start and times.max() <= stop
+        assert np.all(np.diff(times) >= 0)
+        # (time, min), (time, max) pairs
+        np.testing.assert_array_equal(times[::2], times[1::2])
+        assert np.all(values[::2] <= values[1::2])
+
+
+def test_whole_session_envelope(pyramid):
+    pyramid, times, values = pyramid
+    window_times, window_values = pyramid.window(times[0], times[-1], max_points=100)
+    assert len(window_times) <= 100 + 2
+    assert window_values.min() == values.min()
+    assert window_values.max() == values.max()
+
+
+def test_recent_window_is_raw(pyramid):
+    pyramid, times, values = pyramid
+    window_times, window_values = pyramid.window(times[-50], times[-1], max_points=200)
+    np.testing.assert_array_equal(window_times, np.repeat(times[-50:], 2))
+    np.testing.assert_array_equal(window_values, np.repeat(values[-50:], 2))
+
+
+def test_window_outside_data(pyramid):
+    pyramid, times, _ = pyramid
+    window_times, window_values = pyramid.window(times[-1] + 1, times[-1] + 10)
+    assert len(window_times) == len(window_values) == 0
+
+
+def test_empty():
+    pyramid = MinMaxPyramid()
+    times, values = pyramid.window(0, 1)
+    assert len(times) == len(values) == 0
+    assert pyramid.last_time() is None
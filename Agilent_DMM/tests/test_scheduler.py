@@ -0,0 +1,94 @@
+import threading
+import pytest
+import scheduler
+from scheduler import DeadlineScheduler
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep; sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(scheduler.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_no_drift(clock):
+    pacer = DeadlineScheduler(10)
+    pacer.start()
+    for _ in range(100):
+        clock.now += 0.03  # Loop body
+        pacer.wait()
+    assert clock.now == pytest.approx(10.0)
+    assert pacer.skipped == 0
+    assert pacer.report()['lateness_max_ms'] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_skip_drops_missed_ticks(clock):
+    pacer = DeadlineScheduler(10, 'skip')
+    pacer.start()
+    clock.now += 0.35  # Overruns the deadlines at 0.1, 0.2 and 0.3
+    pacer.wait()
+    assert pacer.skipped == 2
+    assert pacer.next_deadline == pytest.approx(0.3)
+    assert pacer.lateness[0] == pytest.approx(0.05)
+    pacer.wait()
+    assert clock.now == pytest.approx(0.4)  # Back on the original grid
+    assert pacer.ticks == 2
+
+
+def test_catch_up_runs_missed_ticks(clock):
+    pacer = DeadlineScheduler(10, 'catch_up')
+    pacer.start()
+    clock.now += 0.35
+    for _ in range(4):
+        pacer.wait()
+    assert pacer.skipped == 0
+    assert pacer.lateness[:4] == pytest.approx([0.25, 0.15, 0.05, 0.0])
+    assert clock.now == pytest.approx(0.4)
+
+
+def test_small_overrun_not_skipped(clock):
+    pacer = DeadlineScheduler(10, 'skip')
+    pacer.start()
+    clock.now += 0.15  # Late for one deadline, but within a period of it
+    pacer.wait()
+    assert pacer.skipped == 0
+    assert pacer.lateness[0] == pytest.approx(0.05)
+
+
+def test_stop_flag_interrupts_wait(clock):
+    pacer = DeadlineScheduler(1)
+    pacer.start()
+    stop_flag = threading.Event()
+    stop_flag.set()
+    assert pacer.wait(stop_flag) is False
+    assert pacer.ticks == 0
+
+
+def test_report(clock):
+    pacer = DeadlineScheduler(100)
+    pacer.start()
+    for _ in range(50):
+        pacer.wait()
+    report = pacer.report()
+    assert report['ticks'] == 50
+    assert report['target_rate'] == pytest.approx(100)
+    assert report['achieved_rate'] == pytest.approx(100)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(10, 'drop')
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from shared_ring import SharedRing
+
+
+@pytest.fixture
+def ring():
+    writer = SharedRing.create(f'test_ring_{os.getpid()}', 100, (0.0, 0.0))
+    reader = SharedRing.attach(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def block(first, n):
+    times = np.arange(first, first + n, dtype=np.float64)
+    return times, -times
+
+
+def test_reads_in_order(ring):
+    writer, reader = ring
+    writer.write(*block(0, 30))
+    writer.write(*block(30, 30))
+    times, voltages, lost = reader.read()
+    np.testing.assert_array_equal(times, np.arange(60))
+    np.testing.assert_array_equal(voltages, -times)
+    assert lost == 0
+    assert len(reader.read()[0]) == 0
+
+
+def test_lapped_reader_counts_losses(ring):
+    writer, reader = ring
+    for first in range(0, 250, 50):
+        writer.write(*block(first, 50))
+    times, _, lost = reader.read()
+    np.testing.assert_array_equal(times, np.arange(150, 250))
+    assert lost == 150
+
+
+def test_write_in_progress_not_returned(ring):
+    writer, reader = ring
+    writer.write(*block(0, 100))
+    # A write of 40 samples that has claimed its slots and overwritten some, but not published yet
+    writer.claimed[0] = 140
+    writer.times[:20] = -1.0
+    times, voltages, lost = reader.read()
+    np.testing.assert_array_equal(times, np.arange(40, 100))
+    assert lost == 40
+    assert not np.any(times == -1.0)
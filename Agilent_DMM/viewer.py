@@ -0,0 +1,63 @@
+"""
+Live plot in its own process, attached to a running session's shared ring.
+
+Start the acquisition with `shared_ring: agilent_dmm` (and `headless: true`
+if the in-process plot isn't wanted), then attach as many viewers as you
+like, whenever you like:
+
+    python viewer.py --name agilent_dmm
+
+Closing the window detaches the viewer; acquisition carries on. The viewer
+exits by itself when the session ends.
+"""
+
+import argparse
+import threading
+import matplotlib.pyplot as plt
+from live_plot import LivePlot
+from shared_ring import SharedRing
+
+
+def follow(ring, plot, stop_flag):
+    """Move new samples from the ring into the plot once per frame."""
+    lost_total = 0
+    while not stop_flag.is_set():
+        times, voltages, lost = ring.read()
+        lost_total += lost
+        if len(voltages):
+            plot.publish(times, voltages)
+        if ring.closed or (plot.fig is not None and not plt.fignum_exists(plot.fig.number)):
+            stop_flag.set()
+        stop_flag.wait(plot.frame_interval)
+    if lost_total:
+        print(f"Viewer fell behind and skipped {lost_total} samples.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attach a live plot to a running acquisition.")
+    parser.add_argument('--name', type=str, default='agilent_dmm', help="Name of the session's shared ring.")
+    parser.add_argument('--max-points', type=int, default=2000, help="Points drawn per frame.")
+    parser.add_argument('--fps', type=float, default=10, help="Frame rate.")
+    parser.add_argument('--window', type=float, help="Follow only the last N seconds.")
+    args = parser.parse_args()
+
+    ring = SharedRing.attach(args.name)
+    plot = LivePlot(args.max_points, args.fps, window=args.window)
+    stop_flag = threading.Event()
+    reader = threading.Thread(target=follow, args=(ring, plot, stop_flag), daemon=True)
+    try:
+        plot.open(float(ring.anchors[1]))
+        reader.start()
+        plot.run(stop_flag)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_flag.set()
+        if reader.is_alive():
+            reader.join()
+        plot.close()
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()